@@ -0,0 +1,31 @@
+import random
+import sys
+
+from benchmarks.common import report_load, run_load, seed_heroes, serve
+
+### Hero CRUD: sync vs HEROES_ASYNC_ENGINE ###
+
+# 50, 200 and 1000 concurrent clients against one uvicorn worker, each
+# looping over single-hero reads (80%, spread over 20,000 heroes so most miss
+# the hero cache) and PATCHes (20%).
+#
+#   python -m benchmarks.async_engine [seconds per run]
+
+heroes = 20_000
+
+async def crud_request(client, worker: int, iteration: int):
+    hero_id = random.randint(1, heroes)
+    if iteration % 5 == 4:
+        return await client.patch(f"/heroes/{hero_id}", json={"age": iteration % 90})
+    return await client.get(f"/heroes/{hero_id}")
+
+def main(duration: float) -> None:
+    for async_engine in ("0", "1"):
+        with serve({"HEROES_ASYNC_ENGINE": async_engine}) as url:
+            seed_heroes(url, heroes)
+            for clients in (50, 200, 1000):
+                result = run_load(url, clients, duration, crud_request)
+                report_load(f"async_engine={async_engine} clients={clients}", result)
+
+if __name__ == "__main__":
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else 10)
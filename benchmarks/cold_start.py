@@ -0,0 +1,77 @@
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.common import repo_root
+
+### Cold start: default vs HEROES_FAST_STARTUP ###
+
+# Every run is a fresh interpreter in an empty directory, so nothing is
+# cached between runs and each one creates its database from scratch. It
+# reports:
+#   import   python -X importtime's cumulative time for "import main"
+#   boot     importing main plus running the lifespan in a TestClient
+#   first    the first GET, POST and PATCH, which build any deferred models
+#
+#   python -m benchmarks.cold_start [runs]
+
+def child() -> None:
+    started_at = time.perf_counter()
+    import main
+    from fastapi.testclient import TestClient
+
+    imported_at = time.perf_counter()
+    with TestClient(main.app) as client:
+        booted_at = time.perf_counter()
+        client.get("/heroes/")
+        hero = client.post("/heroes/", json={"name": "Cold", "secret_name": "Start"}).json()
+        client.patch(f"/heroes/{hero['id']}", json={"age": 1})
+        served_at = time.perf_counter()
+    print(json.dumps({
+        "import_ms": (imported_at - started_at) * 1000,
+        "boot_ms": (booted_at - started_at) * 1000,
+        "first_requests_ms": (served_at - booted_at) * 1000,
+    }))
+
+def run(arguments: list[str], fast_startup: bool) -> subprocess.CompletedProcess:
+    env = {
+        **os.environ,
+        "PYTHONPATH": str(repo_root),
+        "PYTHONWARNINGS": "ignore",
+        "HEROES_FAST_STARTUP": "1" if fast_startup else "0",
+    }
+    with tempfile.TemporaryDirectory(prefix="eduread-bench-") as workdir:
+        return subprocess.run(
+            [sys.executable, *arguments], cwd=workdir, env=env,
+            capture_output=True, text=True, check=True,
+        )
+
+def import_time_ms(fast_startup: bool) -> float:
+    # The last -X importtime line for main holds its cumulative microseconds
+    stderr = run(["-X", "importtime", "-c", "import main"], fast_startup).stderr
+    cumulative = re.findall(r"^import time:\s+\d+ \|\s+(\d+) \| main$", stderr, re.MULTILINE)
+    return int(cumulative[-1]) / 1000
+
+def main(runs: int) -> None:
+    for fast_startup in (False, True):
+        timings = {"importtime_ms": [], "import_ms": [], "boot_ms": [], "first_requests_ms": []}
+        for _ in range(runs):
+            timings["importtime_ms"].append(import_time_ms(fast_startup))
+            result = json.loads(run(["-m", "benchmarks.cold_start", "--child"], fast_startup).stdout)
+            for name, value in result.items():
+                timings[name].append(value)
+        summary = "   ".join(
+            f"{name} {statistics.median(values):7.1f}" for name, values in timings.items()
+        )
+        print(f"fast_startup={fast_startup!s:<5}  {summary}   (median of {runs})")
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["--child"]:
+        child()
+    else:
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else 10)
@@ -0,0 +1,133 @@
+import asyncio
+import contextlib
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+### Benchmark helpers ###
+
+# Benchmarks run from the repository root (python -m benchmarks.<name>) and
+# never touch the tracked database: the app is imported from an empty
+# temporary directory, so it creates a fresh database.db there. Flags such as
+# HEROES_FAST_JSON are read at import, so set them in the environment first.
+#
+# Load benchmarks start a real uvicorn server per configuration instead and
+# drive it from httpx clients in this process; on a small machine the load
+# generator competes with the server for CPU, so compare runs made on the
+# same machine rather than reading the numbers as absolute capacity.
+
+repo_root = Path(__file__).resolve().parent.parent
+
+def fresh_app():
+    sys.path.insert(0, str(repo_root))
+    os.chdir(tempfile.mkdtemp(prefix="eduread-bench-"))
+    import main
+
+    return main.app
+
+def sample_heroes(count: int, start: int = 0) -> list[dict]:
+    return [
+        {"name": f"Hero {i}", "secret_name": f"Secret {i}", "age": None if i % 10 == 0 else i % 90}
+        for i in range(start, start + count)
+    ]
+
+def measure(job, repeat: int) -> list[float]:
+    timings = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        job()
+        timings.append(time.perf_counter() - started_at)
+    return timings
+
+def report(label: str, timings: list[float]) -> None:
+    timings = sorted(timings)
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    print(
+        f"{label:<40} median {statistics.median(timings) * 1000:8.3f} ms"
+        f"   p95 {p95 * 1000:8.3f} ms   n={len(timings)}"
+    )
+
+### Load against a running server ###
+
+@contextlib.contextmanager
+def serve(env: dict[str, str], port: int = 8765):
+    url = f"http://127.0.0.1:{port}"
+    with tempfile.TemporaryDirectory(prefix="eduread-bench-") as workdir:
+        process = subprocess.Popen(
+            [
+                sys.executable, "-m", "uvicorn", "main:app",
+                "--port", str(port), "--log-level", "warning", "--no-access-log",
+            ],
+            cwd=workdir,
+            env={**os.environ, "PYTHONPATH": str(repo_root), "PYTHONWARNINGS": "ignore", **env},
+        )
+        try:
+            wait_until_up(url, process)
+            yield url
+        finally:
+            process.terminate()
+            process.wait()
+
+def wait_until_up(url: str, process: subprocess.Popen, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited with {process.returncode}")
+        with contextlib.suppress(httpx.HTTPError):
+            if httpx.get(f"{url}/").status_code == 200:
+                return
+        time.sleep(0.2)
+    raise RuntimeError("server did not start")
+
+def seed_heroes(url: str, count: int) -> None:
+    for start in range(0, count, 10_000):
+        rows = sample_heroes(min(10_000, count - start), start)
+        httpx.post(f"{url}/heroes/bulk", json=rows, timeout=120).raise_for_status()
+
+def run_load(url: str, clients: int, duration: float, request) -> dict:
+    # request(client, worker, iteration) sends one request and returns the response
+    return asyncio.run(drive_load(url, clients, duration, request))
+
+async def drive_load(url: str, clients: int, duration: float, request) -> dict:
+    latencies: list[float] = []
+    errors = 0
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=120) as client:
+        deadline = time.perf_counter() + duration
+
+        async def worker(number: int) -> None:
+            nonlocal errors
+            iteration = 0
+            while time.perf_counter() < deadline:
+                started_at = time.perf_counter()
+                try:
+                    response = await request(client, number, iteration)
+                    if response.status_code >= 500:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - started_at)
+                iteration += 1
+
+        started_at = time.perf_counter()
+        await asyncio.gather(*(worker(number) for number in range(clients)))
+        elapsed = time.perf_counter() - started_at
+    return {"latencies": latencies, "errors": errors, "elapsed": elapsed}
+
+def report_load(label: str, result: dict) -> None:
+    latencies = sorted(result["latencies"])
+    if not latencies:
+        print(f"{label:<40} no requests completed")
+        return
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(
+        f"{label:<40} {len(latencies) / result['elapsed']:8.1f} req/s"
+        f"   p50 {statistics.median(latencies) * 1000:8.1f} ms"
+        f"   p99 {p99 * 1000:8.1f} ms   errors {result['errors']}"
+    )
@@ -0,0 +1,26 @@
+from fastapi.testclient import TestClient
+
+from benchmarks.common import fresh_app, measure, report, sample_heroes
+
+### Hero list serialization: default vs HEROES_FAST_JSON ###
+
+# Serves the same cached 100-hero page with the flag off and on, so the
+# difference is validation and encoding alone.
+#
+#   python -m benchmarks.fast_json
+
+def main():
+    app = fresh_app()
+    from database import sql_databases
+
+    with TestClient(app) as client:
+        client.post("/heroes/bulk", json=sample_heroes(1000))
+        for fast in (False, True):
+            sql_databases.use_fast_json = fast
+            sql_databases.hero_page_cache.invalidate()
+            client.get("/heroes/", params={"limit": 100})
+            timings = measure(lambda: client.get("/heroes/", params={"limit": 100}), 2000)
+            report(f"GET /heroes/?limit=100 fast_json={fast}", timings)
+
+if __name__ == "__main__":
+    main()
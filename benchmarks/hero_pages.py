@@ -0,0 +1,58 @@
+import sys
+
+from fastapi.testclient import TestClient
+
+from benchmarks.common import fresh_app, measure, report, sample_heroes
+
+### Deep hero list pages: offset vs keyset cursor ###
+
+# Loads N heroes (1,000,000 by default) and fetches a 20-hero page at
+# increasing depths, once by offset and once by the cursor of the hero just
+# before it. The page cache is cleared before every request, so each one
+# reaches SQLite.
+#
+#   python -m benchmarks.hero_pages [heroes]
+
+depths = (0, 10_000, 100_000, 500_000)
+limit = 20
+
+def main(heroes: int) -> None:
+    app = fresh_app()
+    from database import sql_databases
+
+    def page(client, params: dict):
+        sql_databases.hero_page_cache.invalidate()
+        response = client.get("/heroes/", params={"limit": limit, **params})
+        response.raise_for_status()
+        return response
+
+    with TestClient(app) as client:
+        for start in range(0, heroes, 10_000):
+            rows = sample_heroes(min(10_000, heroes - start), start)
+            client.post("/heroes/bulk", json=rows).raise_for_status()
+        for order_by in ("id", "age"):
+            for depth in (*depths, heroes - limit):
+                if depth > heroes - limit:
+                    continue
+                offset = {"order_by": order_by, "offset": depth}
+                report(
+                    f"order_by={order_by} offset={depth}",
+                    measure(lambda: page(client, offset), 20),
+                )
+                if depth == 0:
+                    continue
+                before = page(client, {"order_by": order_by, "offset": depth - 1}).json()[0]
+                cursor = {
+                    "order_by": order_by,
+                    "cursor": sql_databases.encode_cursor(
+                        order_by, sql_databases.HeroResponse(**before)
+                    ),
+                }
+                assert page(client, cursor).json() == page(client, offset).json()
+                report(
+                    f"order_by={order_by} cursor at {depth}",
+                    measure(lambda: page(client, cursor), 200),
+                )
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
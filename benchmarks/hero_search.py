@@ -0,0 +1,66 @@
+import sys
+
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from sqlmodel import Session
+
+from benchmarks.common import fresh_app, measure, report
+
+### Hero search: FTS5 vs LIKE '%q%' ###
+
+# Loads N heroes (1,000,000 by default) named "<word> <word> <number>" from
+# a 40-word vocabulary, then times a 20-row page of GET /heroes/search
+# against the same page from a LIKE scan of hero.name. Queries cover a
+# common word (about 1 in 20 heroes), a rare number and a miss. The page
+# cache is not involved: search is not cached.
+#
+#   python -m benchmarks.hero_search [heroes]
+
+words = [
+    "amber", "bolt", "cinder", "dusk", "ember", "frost", "gale", "harbor",
+    "iron", "jade", "karma", "lumen", "marsh", "nova", "onyx", "prism",
+    "quartz", "raven", "storm", "thorn", "umber", "vapor", "willow", "xenon",
+    "yarrow", "zephyr", "ash", "brook", "crest", "drift", "echo", "flint",
+    "grove", "haze", "ivy", "juniper", "kestrel", "lark", "moss", "nettle",
+]
+
+like_query = text("""
+    SELECT id, name, age, team_id FROM hero
+    WHERE name LIKE :pattern
+    ORDER BY id
+    LIMIT 20
+""")
+
+def hero_rows(count: int, start: int) -> list[dict]:
+    return [
+        {
+            "name": f"{words[i % 40]} {words[i // 40 % 40]} {i}",
+            "secret_name": f"Secret {i}",
+            "age": i % 90,
+        }
+        for i in range(start, start + count)
+    ]
+
+def main(heroes: int) -> None:
+    app = fresh_app()
+    from database.sql_databases import read_engine
+
+    with TestClient(app) as client:
+        for start in range(0, heroes, 10_000):
+            rows = hero_rows(min(10_000, heroes - start), start)
+            client.post("/heroes/bulk", json=rows).raise_for_status()
+        for label, q in (("common word", "storm"), ("rare number", str(heroes // 2)), ("miss", "qqq")):
+            def search():
+                response = client.get("/heroes/search", params={"q": q, "limit": 20})
+                response.raise_for_status()
+
+            def like():
+                with Session(read_engine) as session:
+                    session.execute(like_query, {"pattern": f"%{q}%"}).all()
+
+            repeat = 200 if label != "miss" else 50
+            report(f"{label}: GET /heroes/search", measure(search, repeat))
+            report(f"{label}: LIKE '%q%' query", measure(like, max(5, repeat // 10)))
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -0,0 +1,61 @@
+import asyncio
+import random
+import sys
+
+from benchmarks.common import drive_load, report_load, seed_heroes, serve
+
+### Hero reads under write load ###
+
+# 20 clients reading list pages and single heroes, first alone and then
+# next to 10 clients doing nothing but hero creates and PATCHes, against one
+# uvicorn worker in three setups:
+#   default     rollback journal; readers wait while a write holds the lock
+#   production  WAL, reads through the mode=ro engine
+#   replica     production plus HEROES_READ_REPLICA, reads from a copy of
+#               the file refreshed every second
+#
+#   python -m benchmarks.read_routing [seconds per run]
+
+heroes = 20_000
+readers = 20
+writers = 10
+
+setups = {
+    "default": {"HEROES_SQLITE_PROFILE": "default"},
+    "production": {},
+    "replica": {"HEROES_READ_REPLICA": "replica.db"},
+}
+
+async def read_request(client, worker: int, iteration: int):
+    if iteration % 2:
+        return await client.get(f"/heroes/{random.randint(1, heroes)}")
+    offset = random.randrange(heroes - 100)
+    return await client.get("/heroes/", params={"offset": offset, "limit": 20})
+
+async def write_request(client, worker: int, iteration: int):
+    if iteration % 2:
+        return await client.post(
+            "/heroes/", json={"name": f"Writer {worker}.{iteration}", "secret_name": "Secret"}
+        )
+    return await client.patch(
+        f"/heroes/{random.randint(1, heroes)}", json={"age": random.randint(1, 90)}
+    )
+
+async def mixed_load(url: str, duration: float) -> tuple[dict, dict]:
+    return await asyncio.gather(
+        drive_load(url, readers, duration, read_request),
+        drive_load(url, writers, duration, write_request),
+    )
+
+def main(duration: float) -> None:
+    for name, env in setups.items():
+        with serve(env) as url:
+            seed_heroes(url, heroes)
+            alone = asyncio.run(drive_load(url, readers, duration, read_request))
+            report_load(f"{name} reads alone", alone)
+            reads, writes = asyncio.run(mixed_load(url, duration))
+            report_load(f"{name} reads with writers", reads)
+            report_load(f"{name} writes", writes)
+
+if __name__ == "__main__":
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else 10)
@@ -0,0 +1,34 @@
+import random
+import sys
+
+from benchmarks.common import report_load, run_load, seed_heroes, serve
+
+### Mixed read/write load: HEROES_SQLITE_PROFILE default vs production ###
+
+# 100 clients against one uvicorn worker, 90% list pages at random offsets and
+# 10% hero creates, with SQLite's defaults (rollback journal, full fsync,
+# SQLAlchemy's pool of 5 plus 10 overflow) and then the production profile (WAL, NORMAL sync,
+# 20 pooled connections that may overflow).
+#
+#   python -m benchmarks.sqlite_profile [seconds per run]
+
+heroes = 20_000
+clients = 100
+
+async def mixed_request(client, worker: int, iteration: int):
+    if iteration % 10 == 9:
+        return await client.post(
+            "/heroes/", json={"name": f"Load {worker}.{iteration}", "secret_name": "Secret"}
+        )
+    offset = random.randrange(heroes - 100)
+    return await client.get("/heroes/", params={"offset": offset, "limit": 20})
+
+def main(duration: float) -> None:
+    for profile in ("default", "production"):
+        with serve({"HEROES_SQLITE_PROFILE": profile}) as url:
+            seed_heroes(url, heroes)
+            result = run_load(url, clients, duration, mixed_request)
+            report_load(f"profile={profile} clients={clients}", result)
+
+if __name__ == "__main__":
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else 10)
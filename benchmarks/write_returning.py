@@ -0,0 +1,63 @@
+import random
+
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+
+from benchmarks.common import fresh_app, measure, report
+
+### Hero writes: commit + refresh vs RETURNING ###
+
+# "before" is the write path the routes used to have: add or modify the ORM
+# object, commit, then session.refresh() to read the row back. "after" is
+# add_hero/change_hero, which get the row from INSERT/UPDATE ... RETURNING.
+# Both run on a fresh session per write, like a request, against the same
+# database.
+#
+#   python -m benchmarks.write_returning
+
+writes = 2000
+
+def main() -> None:
+    app = fresh_app()
+    from database import sql_databases
+    from database.sql_databases import Hero, HeroCreate, HeroUpdate, engine
+
+    hero = HeroCreate(name="Writer", secret_name="Secret", age=30)
+
+    def create_before():
+        with Session(engine) as session:
+            db_hero = Hero.model_validate(hero)
+            session.add(db_hero)
+            session.commit()
+            session.refresh(db_hero)
+
+    def create_after():
+        with Session(engine) as session:
+            sql_databases.add_hero(session, hero)
+
+    def update_before():
+        with Session(engine) as session:
+            db_hero = session.get(Hero, random.randint(1, writes))
+            db_hero.sqlmodel_update({"age": random.randint(1, 90)})
+            session.add(db_hero)
+            session.commit()
+            session.refresh(db_hero)
+
+    def update_after():
+        with Session(engine) as session:
+            update = HeroUpdate(age=random.randint(1, 90))
+            sql_databases.change_hero(session, random.randint(1, writes), update)
+
+    # The lifespan creates the schema and loads the hero stats
+    with TestClient(app):
+        for label, job in (
+            ("create before (commit + refresh)", create_before),
+            ("create after (RETURNING)", create_after),
+            ("update before (get + commit + refresh)", update_before),
+            ("update after (RETURNING)", update_after),
+        ):
+            job()
+            report(label, measure(job, writes))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+### LRU cache with TTL and generation-based invalidation ###
+
+# Entries expire after `ttl` seconds and the least recently used entry is
+# evicted once `maxsize` is reached. `invalidate()` bumps the generation and
+# drops every entry. A reader captures `generation` before it queries the
+# database and hands it back to `set()`, so a result read before a concurrent
+# write can never be cached after that write invalidated it. `set()` may give
+# an entry a shorter ttl than the default, and with `newer` it only replaces
+# a cached value when newer(cached, value) holds, so writers that finish out
+# of order cannot leave the older value behind.
+
+class LRUCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict[Hashable, tuple[float, int, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, generation, value = entry
+                if generation == self.generation and expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return default
+
+    def set(
+        self,
+        key: Hashable,
+        value: Any,
+        generation: int | None = None,
+        ttl: float | None = None,
+        newer: Callable[[Any, Any], bool] | None = None,
+    ) -> None:
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            if newer is not None and key in self._entries:
+                if not newer(self._entries[key][2], value):
+                    return
+            expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+            self._entries[key] = (expires_at, self.generation, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+    def footprint(self, sizeof: Callable[[Any], int] = sys.getsizeof) -> int:
+        # Approximate bytes held by keys and values, as measured by `sizeof`
+        with self._lock:
+            return sum(
+                sizeof(key) + sizeof(value)
+                for key, (_, _, value) in self._entries.items()
+            )
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            "evictions": self.evictions,
+            "generation": self.generation,
+        }
@@ -0,0 +1,172 @@
+import logging
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+
+from fastapi import APIRouter
+from sqlalchemy import Engine, event
+
+logger = logging.getLogger(__name__)
+
+### Per-request database instrumentation ###
+
+# Cursor events on the Engine class cover every engine and therefore every
+# session dependency, sync or async, present or future. Statements are
+# attributed to the request whose RequestQueries is in the current context;
+# the middleware installs one per HTTP request, and since contexts are copied
+# into the threadpool and into SQLAlchemy's greenlets, the handler's queries
+# all land on it. Work outside a request (startup, background jobs, the
+# group-commit writer thread) is not attributed.
+
+# A statement repeated this many times with different parameters in one
+# request is reported as a likely N+1 query. executemany calls and
+# statements run with execution_options(chunked=True) are deliberate loops
+# over chunks of one batch (bulk loads, bulk deletes) and are not counted.
+repeated_statement_threshold = 5
+
+# /db/metrics is public and parameters carry secret names, usernames and
+# token ids, so the slowest statement only keeps the types of its parameters
+def parameter_types(parameters):
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (list, tuple, dict)):
+            return f"{len(parameters)} rows of {parameter_types(parameters[0])}"
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__
+
+class RequestQueries:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.slowest: tuple[float, str, str] | None = None
+        self.statements: Counter[str] = Counter()
+
+    def record(
+        self, statement: str, parameters, duration: float, chunked: bool = False
+    ) -> None:
+        self.count += 1
+        self.duration += duration
+        if not chunked:
+            self.statements[statement] += 1
+        if self.slowest is None or duration > self.slowest[0]:
+            self.slowest = (duration, statement, str(parameter_types(parameters))[:500])
+
+    def repeated(self) -> list[tuple[str, int]]:
+        return [
+            (statement, count)
+            for statement, count in self.statements.items()
+            if count >= repeated_statement_threshold
+        ]
+
+current_queries: ContextVar[RequestQueries | None] = ContextVar(
+    "current_queries", default=None
+)
+
+@event.listens_for(Engine, "before_cursor_execute")
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._query_started_at = time.perf_counter()
+
+@event.listens_for(Engine, "after_cursor_execute")
+def record_query(conn, cursor, statement, parameters, context, executemany):
+    queries = current_queries.get()
+    started_at = getattr(context, "_query_started_at", None)
+    if queries is not None and started_at is not None:
+        chunked = executemany or context.execution_options.get("chunked", False)
+        queries.record(statement, parameters, time.perf_counter() - started_at, chunked)
+
+### Aggregated metrics ###
+
+class QueryMetrics:
+    def __init__(self, recent: int = 100):
+        self.requests = 0
+        self.queries = 0
+        self.duration = 0.0
+        self.repeated_statement_warnings = 0
+        self.recent: deque[dict] = deque(maxlen=recent)
+        self._lock = threading.Lock()
+
+    def add(self, path: str, queries: RequestQueries, repeated: list) -> None:
+        summary = {
+            "path": path,
+            "queries": queries.count,
+            "db_time_ms": round(queries.duration * 1000, 3),
+            "slowest": None,
+            "repeated_statements": [
+                {"statement": statement, "count": count} for statement, count in repeated
+            ],
+        }
+        if queries.slowest:
+            duration, statement, parameters = queries.slowest
+            summary["slowest"] = {
+                "statement": statement,
+                "parameters": parameters,
+                "time_ms": round(duration * 1000, 3),
+            }
+        with self._lock:
+            self.requests += 1
+            self.queries += queries.count
+            self.duration += queries.duration
+            self.repeated_statement_warnings += bool(repeated)
+            self.recent.append(summary)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "queries": self.queries,
+                "db_time_ms": round(self.duration * 1000, 3),
+                "repeated_statement_warnings": self.repeated_statement_warnings,
+                "recent": list(self.recent),
+            }
+
+query_metrics = QueryMetrics()
+
+### Middleware ###
+
+# A plain ASGI middleware rather than BaseHTTPMiddleware so the handler runs
+# in a copy of our context. The counts go out as X-DB-Query-Count and
+# X-DB-Time-Ms when the response starts; for streaming responses that is
+# before the body's own queries run.
+
+class QueryInstrumentationMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        queries = RequestQueries()
+        token = current_queries.set(queries)
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-db-query-count", str(queries.count).encode()))
+                headers.append(
+                    (b"x-db-time-ms", f"{queries.duration * 1000:.3f}".encode())
+                )
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_headers)
+        finally:
+            current_queries.reset(token)
+            repeated = queries.repeated()
+            for statement, count in repeated:
+                logger.warning(
+                    "%s %s ran the same statement %d times (possible N+1): %s",
+                    scope["method"], scope["path"], count, statement,
+                )
+            query_metrics.add(scope["path"], queries, repeated)
+
+router = APIRouter()
+
+@router.get("/db/metrics")
+def read_db_metrics():
+    return query_metrics.snapshot()
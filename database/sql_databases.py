@@ -1,7 +1,79 @@
-from typing import Annotated
+import asyncio
+import base64
+import csv
+import functools
+import hashlib
+import heapq
+import io
+import itertools
+import json
+import logging
+import os
+import re
+import sqlite3
+import time
+from contextlib import closing
+from typing import Annotated, Literal, Optional
 
-from fastapi import Depends, APIRouter, HTTPException, Query
-from sqlmodel import Field, Session, SQLModel, create_engine, select
+from fastapi import (
+    Body,
+    Depends,
+    APIRouter,
+    Header,
+    HTTPException,
+    Path,
+    Query,
+    Request,
+    Response,
+)
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from pydantic import ConfigDict, TypeAdapter, ValidationError
+from sqlalchemy import (
+    and_,
+    bindparam,
+    case,
+    delete,
+    event,
+    func,
+    insert,
+    or_,
+    text,
+    union_all,
+    update,
+)
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.ext.horizontal_shard import ShardedSession
+from sqlalchemy.orm import joinedload, selectinload
+from sqlalchemy.schema import CreateIndex, CreateTable
+from sqlalchemy.sql import column as sql_column, table as sql_table
+from sqlalchemy.sql.expression import UnaryExpression
+from sqlalchemy.sql.operators import custom_op
+from sqlmodel import Field, Relationship, Session, SQLModel, create_engine, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from database.cache import LRUCache
+from database.stats import AgeStats
+from database.write_queue import GroupCommitWriter
+
+logger = logging.getLogger(__name__)
+
+### Cold start ###
+
+# HEROES_FAST_STARTUP=1 keeps work out of the way of the first request:
+# pydantic models that no route takes as a body are built on first use
+# (defer_build), create_all and the migrations are skipped when the schema
+# fingerprint stored in the database file matches this code, and the first
+# stats reconciliation runs in the background instead of before serving.
+# Every boot records how long each phase took in startup_timings, logs it
+# and serves it at GET /heroes/startup.
+
+fast_startup = os.getenv("HEROES_FAST_STARTUP", "0") == "1"
+
+startup_timings: dict[str, float | bool | None] = {}
+
+module_started_at = time.perf_counter()
 
 ### Create Models ###
 # class Hero(SQLModel, table=True):
@@ -17,22 +89,307 @@ sqlite_url = f"sqlite:///{sqlite_file_name}"
 
 connect_args = {"check_same_thread": False}
 
-engine = create_engine(sqlite_url, connect_args=connect_args)
+### Production SQLite profile ###
+
+# HEROES_SQLITE_PROFILE=production (the default) switches the file to WAL so
+# readers are not blocked behind hero writes, relaxes fsyncs to NORMAL and
+# keeps 20 pooled connections with no cap on overflow. A sync request holds
+# its connection until its dependency exits, which is after the response is
+# serialized on the threadpool; a capped pool lets 40 endpoints wait on
+# connections held by requests waiting on threads, and everything stalls
+# until the pool timeout. "default" keeps SQLite and SQLAlchemy defaults.
+sqlite_profile = os.getenv("HEROES_SQLITE_PROFILE", "production")
+
+sqlite_pragmas = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -64 * 1024,  # negative means KiB, so 64 MiB
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000,
+}
+
+engine_options = {}
+if sqlite_profile == "production":
+    engine_options = {"pool_size": 20, "max_overflow": -1}
+
+# Read-only connections cannot change the journal mode or sync level
+sqlite_read_pragmas = {
+    pragma: value
+    for pragma, value in sqlite_pragmas.items()
+    if pragma not in ("journal_mode", "synchronous")
+}
+
+def set_sqlite_pragmas(dbapi_connection, pragmas: dict):
+    cursor = dbapi_connection.cursor()
+    for pragma, value in pragmas.items():
+        cursor.execute(f"PRAGMA {pragma}={value}")
+    cursor.close()
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    set_sqlite_pragmas(dbapi_connection, sqlite_pragmas)
+
+def apply_sqlite_read_pragmas(dbapi_connection, connection_record):
+    set_sqlite_pragmas(dbapi_connection, sqlite_read_pragmas)
+
+engine = create_engine(sqlite_url, connect_args=connect_args, **engine_options)
+
+### Create the async database engine ###
+
+# Set HEROES_ASYNC_ENGINE=1 to serve the hero routes from an AsyncSession on the
+# aiosqlite driver instead of a blocking Session in the threadpool.
+use_async_engine = os.getenv("HEROES_ASYNC_ENGINE", "0") == "1"
+
+async_sqlite_url = f"sqlite+aiosqlite:///{sqlite_file_name}"
+
+async_engine = create_async_engine(
+    async_sqlite_url, connect_args=connect_args, **engine_options
+)
+
+### Create the read-only database engines ###
+
+# GET routes read through a separate mode=ro engine, so readers never take
+# the write lock and never queue for connections behind writers. With
+# HEROES_READ_REPLICA=<path> they read a copy of the database instead, which
+# is refreshed with the SQLite backup API every read_replica_interval
+# seconds. Reads there can lag writes by up to that interval, and a lagging
+# read can sit in the hero caches until their TTL expires.
+read_replica_file = os.getenv("HEROES_READ_REPLICA")
+read_replica_interval = 1.0
+
+read_file_name = read_replica_file or sqlite_file_name
+read_sqlite_url = f"sqlite:///file:{read_file_name}?mode=ro&uri=true"
+async_read_sqlite_url = f"sqlite+aiosqlite:///file:{read_file_name}?mode=ro&uri=true"
+
+read_engine = create_engine(read_sqlite_url, connect_args=connect_args, **engine_options)
+
+async_read_engine = create_async_engine(
+    async_read_sqlite_url, connect_args=connect_args, **engine_options
+)
+
+def copy_read_replica():
+    with closing(sqlite3.connect(sqlite_file_name)) as source:
+        with closing(sqlite3.connect(read_replica_file)) as target:
+            source.backup(target)
+
+### Sharded hero storage ###
+
+# HEROES_SHARDS=N (N > 1) spreads heroes over N files, database-shard<k>.db,
+# so writes to different shards no longer queue behind one write lock. A
+# hero lives on shard (id - 1) % N: each shard hands out the ids k+1, k+1+N,
+# ... itself, and new heroes go to the shards in turn. The hero table in
+# database.db is left unused.
+#
+# Sessions become ShardedHeroSession, which routes each ORM statement on
+# heroes by its shard_hero_ids execution option (see on_heroes) to the shards
+# that own those ids, and anything else to every shard with the results
+# concatenated. Bound parameters are never looked at: a cursor also binds
+# hero_id, and that id says nothing about where the page lives.
+# Statements on any other table go to database.db, the "main" shard. The hero
+# list, search and export query the shards one by one and merge the pages
+# on their sort key (see merge_shard_rows).
+hero_shard_count = int(os.getenv("HEROES_SHARDS", "1"))
+use_shards = hero_shard_count > 1
+
+if use_shards and read_replica_file:
+    raise RuntimeError("HEROES_READ_REPLICA is not supported with HEROES_SHARDS")
+
+hero_shards = [str(shard) for shard in range(hero_shard_count)] if use_shards else []
+
+def shard_file_name(shard: str) -> str:
+    return f"database-shard{shard}.db"
+
+shard_engines = {
+    shard: create_engine(
+        f"sqlite:///{shard_file_name(shard)}", connect_args=connect_args, **engine_options
+    )
+    for shard in hero_shards
+}
+async_shard_engines = {
+    shard: create_async_engine(
+        f"sqlite+aiosqlite:///{shard_file_name(shard)}",
+        connect_args=connect_args,
+        **engine_options,
+    )
+    for shard in hero_shards
+}
+read_shard_engines = {
+    shard: create_engine(
+        f"sqlite:///file:{shard_file_name(shard)}?mode=ro&uri=true",
+        connect_args=connect_args,
+        **engine_options,
+    )
+    for shard in hero_shards
+}
+async_read_shard_engines = {
+    shard: create_async_engine(
+        f"sqlite+aiosqlite:///file:{shard_file_name(shard)}?mode=ro&uri=true",
+        connect_args=connect_args,
+        **engine_options,
+    )
+    for shard in hero_shards
+}
+
+# Where the hero table and its search index live
+hero_engines = list(shard_engines.values()) or [engine]
+
+def hero_shard(hero_id: int) -> str:
+    return hero_shards[(hero_id - 1) % hero_shard_count]
+
+def choose_instance_shard(mapper, instance, clause=None):
+    if mapper is None or mapper.class_ is not Hero:
+        return "main"
+    return hero_shard(instance.id)
+
+def choose_identity_shards(mapper, primary_key, **kwargs):
+    if mapper.class_ is not Hero:
+        return ["main"]
+    return [hero_shard(primary_key[0])]
+
+def choose_query_shards(orm_context):
+    if orm_context.bind_mapper is None or orm_context.bind_mapper.class_ is not Hero:
+        return ["main"]
+    hero_ids = orm_context.execution_options.get("shard_hero_ids")
+    if hero_ids is None:
+        return hero_shards
+    return sorted({hero_shard(hero_id) for hero_id in hero_ids}) or hero_shards
+
+def on_heroes(hero_ids) -> dict:
+    # Execution options for a statement that only touches these heroes
+    return {"shard_hero_ids": list(hero_ids)}
+
+class ShardedHeroSession(ShardedSession, Session):
+    pass
+
+def sharded_session_options(engines: dict, main) -> dict:
+    return {
+        "shards": {**engines, "main": main},
+        "shard_chooser": choose_instance_shard,
+        "identity_chooser": choose_identity_shards,
+        "execute_chooser": choose_query_shards,
+    }
+
+def merge_shard_rows(shard_rows, key, offset: int, limit: int) -> list:
+    # Every shard's rows are already sorted on key, so a k-way merge gives
+    # the global order; each shard had to return its first offset + limit
+    return list(itertools.islice(heapq.merge(*shard_rows, key=key), offset, offset + limit))
+
+if sqlite_profile == "production":
+    event.listen(engine, "connect", apply_sqlite_pragmas)
+    event.listen(async_engine.sync_engine, "connect", apply_sqlite_pragmas)
+    event.listen(read_engine, "connect", apply_sqlite_read_pragmas)
+    event.listen(async_read_engine.sync_engine, "connect", apply_sqlite_read_pragmas)
+    for shard in hero_shards:
+        event.listen(shard_engines[shard], "connect", apply_sqlite_pragmas)
+        event.listen(async_shard_engines[shard].sync_engine, "connect", apply_sqlite_pragmas)
+        event.listen(read_shard_engines[shard], "connect", apply_sqlite_read_pragmas)
+        event.listen(
+            async_read_shard_engines[shard].sync_engine, "connect", apply_sqlite_read_pragmas
+        )
 
 
 ### Create the database tables ###
-def create_db_and_tables():
-    SQLModel.metadata.create_all(engine)
+def create_db_and_tables() -> bool:
+    # Returns False when a matching schema fingerprint let us skip the work
+    fingerprint = schema_fingerprint()
+    created = False
+    for target in dict.fromkeys([engine, *hero_engines]):
+        if fast_startup and stored_schema_fingerprint(target) == fingerprint:
+            continue
+        # Shards only hold heroes; teams and powers stay in database.db
+        tables = None if target is engine else [hero_table]
+        SQLModel.metadata.create_all(target, tables=tables)
+        migrate_hero_table(target)
+        create_hero_search_index(target)
+        if not use_shards:
+            with target.begin() as connection:
+                connection.execute(text(hero_powers_trigger))
+        with target.begin() as connection:
+            connection.exec_driver_sql(f"PRAGMA user_version = {fingerprint}")
+        created = True
+    return created
+
+### Schema fingerprint ###
+
+# A hash of the DDL this code would create, kept in SQLite's user_version
+# header field (31 bits) once create_all and the migrations have run.
+
+def schema_fingerprint() -> int:
+    ddl = []
+    for table in SQLModel.metadata.sorted_tables:
+        ddl.append(str(CreateTable(table).compile(engine)))
+        ddl.extend(str(CreateIndex(index).compile(engine)) for index in table.indexes)
+    ddl.extend(hero_search_ddl)
+    ddl.append(hero_powers_trigger)
+    digest = hashlib.sha256("\n".join(ddl).encode()).digest()
+    return int.from_bytes(digest[:4]) >> 1
+
+def stored_schema_fingerprint(target) -> int:
+    with target.connect() as connection:
+        return connection.exec_driver_sql("PRAGMA user_version").scalar()
     
 
 ### Create a Session Dependency ###
 
+def make_session() -> Session:
+    if use_shards:
+        return ShardedHeroSession(**sharded_session_options(shard_engines, engine))
+    return Session(engine)
+
 def get_session():
-    with Session(engine) as session:
+    with make_session() as session:
         yield session
         
 SessionDependency = Annotated[Session, Depends(get_session)]
 
+### Create an Async Session Dependency ###
+
+def make_async_session() -> AsyncSession:
+    if use_shards:
+        engines = {shard: async_shard.sync_engine for shard, async_shard in async_shard_engines.items()}
+        return AsyncSession(
+            sync_session_class=ShardedHeroSession,
+            **sharded_session_options(engines, async_engine.sync_engine),
+        )
+    return AsyncSession(async_engine)
+
+async def get_async_session():
+    async with make_async_session() as session:
+        yield session
+
+AsyncSessionDependency = Annotated[AsyncSession, Depends(get_async_session)]
+
+### Create Read Session Dependencies ###
+
+def make_read_session() -> Session:
+    if use_shards:
+        return ShardedHeroSession(**sharded_session_options(read_shard_engines, read_engine))
+    return Session(read_engine)
+
+def get_read_session():
+    with make_read_session() as session:
+        yield session
+
+ReadSessionDependency = Annotated[Session, Depends(get_read_session)]
+
+def make_async_read_session() -> AsyncSession:
+    if use_shards:
+        engines = {
+            shard: async_shard.sync_engine
+            for shard, async_shard in async_read_shard_engines.items()
+        }
+        return AsyncSession(
+            sync_session_class=ShardedHeroSession,
+            **sharded_session_options(engines, async_read_engine.sync_engine),
+        )
+    return AsyncSession(async_read_engine)
+
+async def get_async_read_session():
+    async with make_async_read_session() as session:
+        yield session
+
+AsyncReadSessionDependency = Annotated[AsyncSession, Depends(get_async_read_session)]
+
 
 ### Create Database Tables on Application Startup ###
 from contextlib import asynccontextmanager
@@ -42,8 +399,47 @@ from contextlib import asynccontextmanager
 
 @asynccontextmanager
 async def on_startup(app: APIRouter):
-    create_db_and_tables()
+    startup_timings.clear()
+    startup_timings["import_ms"] = import_ms
+    started_at = time.perf_counter()
+    startup_timings["schema_created"] = timed("schema_ms", create_db_and_tables)
+    jobs = [run_periodically(hero_stats_reconcile_interval, reconcile_hero_stats)]
+    if fast_startup:
+        # Counts are zero until this first reconciliation lands
+        jobs.append(run_in_threadpool(reconcile_hero_stats))
+    else:
+        timed("stats_ms", reconcile_hero_stats)
+    if read_replica_file:
+        timed("replica_ms", copy_read_replica)
+        jobs.append(run_periodically(read_replica_interval, copy_read_replica))
+    tasks = [asyncio.create_task(job) for job in jobs]
+    startup_timings["startup_ms"] = round((time.perf_counter() - started_at) * 1000, 3)
+    logger.info("Hero service startup: %s", startup_timings)
     yield
+    for task in tasks:
+        task.cancel()
+    hero_writer.stop()
+    await async_engine.dispose()
+    await async_read_engine.dispose()
+    for shard in hero_shards:
+        await async_shard_engines[shard].dispose()
+        await async_read_shard_engines[shard].dispose()
+
+def timed(phase: str, job):
+    started_at = time.perf_counter()
+    result = job()
+    startup_timings[phase] = round((time.perf_counter() - started_at) * 1000, 3)
+    return result
+
+async def run_periodically(interval: float, job):
+    # A failed run (say a locked database under write load) is logged and the
+    # job tried again next interval; an uncaught error would end the task
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await run_in_threadpool(job)
+        except Exception:
+            logger.exception("Periodic job %s failed", job.__qualname__)
     
 router = APIRouter(lifespan=on_startup)
 
@@ -92,66 +488,1269 @@ router = APIRouter(lifespan=on_startup)
 
 ### Create Multiple Models ###
 
+# SQLite integers are signed 64-bit and a larger Python int only fails once
+# it is bound, as a 500, so every integer the hero and team routes accept is
+# checked against that range up front
+sqlite_int_min = -2**63
+sqlite_int_max = 2**63 - 1
+sqlite_int_bounds = {"ge": sqlite_int_min, "le": sqlite_int_max}
+
+def is_sqlite_int(value) -> bool:
+    # bool is an int subclass but never a valid id or age
+    return type(value) is int and sqlite_int_min <= value <= sqlite_int_max
+
+IdPath = Annotated[int, Path(**sqlite_int_bounds)]
+OffsetQuery = Annotated[int, Query(ge=0, le=sqlite_int_max)]
+
 class HeroBase(SQLModel):
     name: str = Field(index=True)
-    age: int | None = Field(default=None, index=True)
+    age: int | None = Field(default=None, index=True, **sqlite_int_bounds)
+    # Not checked against team: SQLite foreign keys are off, and hero shards
+    # cannot see the team table anyway
+    team_id: int | None = Field(
+        default=None, foreign_key="team.id", index=True, **sqlite_int_bounds
+    )
     
 class Hero(HeroBase, table=True):
+    # Only models that never appear as a route body are deferred: FastAPI
+    # rebuilding a deferred body adapter on first use warns about aliases
+    model_config = ConfigDict(defer_build=fast_startup)
+    # Ids are never reused, so "<id>.<version>" ETags stay unique
+    __table_args__ = {"sqlite_autoincrement": True}
+
     id: int | None = Field(default=None, primary_key=True)
     secret_name: str
+    version: int = Field(default=1, sa_column_kwargs={"server_default": "1"})
+
+    team: Optional["Team"] = Relationship(back_populates="heroes")
+    powers: list["Power"] = Relationship(back_populates="hero")
     
 class HeroResponse(HeroBase):
     id: int
+
+# HeroResponse plus the row version. Routes still declare HeroResponse as
+# their response_model, so the version only reaches clients as the ETag.
+class HeroRecord(HeroResponse):
+    model_config = ConfigDict(defer_build=fast_startup)
+
+    version: int
     
 class HeroCreate(HeroBase):
     secret_name: str
     
 class HeroUpdate(SQLModel):
     name: str | None = None
-    age: int | None = None
+    age: int | None = Field(default=None, **sqlite_int_bounds)
+    team_id: int | None = Field(default=None, **sqlite_int_bounds)
     secret_name: str | None = None
 
-#### Create a Hero with the new models ###    
-    
-@router.post("/heroes/", response_model=HeroResponse)
-def create_hero(hero: HeroCreate, session: SessionDependency):
-    db_hero = Hero.model_validate(hero)
-    session.add(db_hero)
+class HeroBatchUpdate(HeroUpdate):
+    id: int = Field(**sqlite_int_bounds)
+    # Optional optimistic-concurrency check, like If-Match on a single PATCH
+    version: int | None = Field(default=None, **sqlite_int_bounds)
+
+### Teams and powers ###
+
+# A hero belongs to at most one team and has any number of powers. Teams and
+# powers always live in database.db, also when heroes are sharded.
+
+class TeamBase(SQLModel):
+    name: str = Field(index=True)
+    headquarters: str
+
+class Team(TeamBase, table=True):
+    id: int | None = Field(default=None, primary_key=True)
+
+    heroes: list[Hero] = Relationship(back_populates="team")
+
+class TeamResponse(TeamBase):
+    id: int
+
+class TeamCreate(TeamBase):
+    pass
+
+class PowerBase(SQLModel):
+    name: str
+
+class Power(PowerBase, table=True):
+    id: int | None = Field(default=None, primary_key=True)
+    hero_id: int = Field(foreign_key="hero.id", index=True)
+
+    hero: Hero = Relationship(back_populates="powers")
+
+class PowerResponse(PowerBase):
+    id: int
+
+class PowerCreate(PowerBase):
+    pass
+
+class HeroResponseWithTeam(HeroResponse):
+    team: TeamResponse | None = None
+    powers: list[PowerResponse] = []
+
+class TeamResponseWithHeroes(TeamResponse):
+    heroes: list[HeroResponse] = []
+
+class HeroListParams(SQLModel):
+    offset: int = Field(0, ge=0, le=sqlite_int_max)
+    limit: int = Field(100, ge=0, le=100)
+    cursor: str | None = None
+    order_by: Literal["id", "name", "age"] = "id"
+    min_age: int | None = Field(None, **sqlite_int_bounds)
+    max_age: int | None = Field(None, **sqlite_int_bounds)
+    name_prefix: str | None = Field(None, min_length=1)
+
+### Hero list filters ###
+
+# Filters are plain range predicates on indexed columns so SQLite can SEARCH
+# ix_hero_age / ix_hero_name instead of scanning: a name prefix becomes
+# name >= prefix AND name < (prefix with its last character incremented),
+# which works with the default BINARY collation where LIKE 'prefix%' would
+# not. Each filter is bound by name and only present filters are compiled in.
+
+hero_filters = {
+    "min_age": Hero.age >= bindparam("min_age"),
+    "max_age": Hero.age <= bindparam("max_age"),
+    "name_from": Hero.name >= bindparam("name_from"),
+    "name_to": Hero.name < bindparam("name_to"),
+}
+
+hero_filter_columns = {"min_age": "age", "max_age": "age", "name_from": "name", "name_to": "name"}
+
+def unindexed(column):
+    # SQLite will not use an index for "+column"; when the list is filtered on
+    # another column this keeps a LIMITed ORDER BY from turning the filter
+    # into a full scan in index order, so the filter's index drives the plan
+    return UnaryExpression(column, operator=custom_op("+"))
+
+def prefix_upper_bound(prefix: str) -> str | None:
+    # Smallest string greater than every string starting with prefix
+    while prefix:
+        last = ord(prefix[-1])
+        if last < 0x10FFFF:
+            return prefix[:-1] + chr(last + 1)
+        prefix = prefix[:-1]
+    return None
+
+def hero_filter_params(params: HeroListParams) -> dict:
+    bind = {}
+    if params.min_age is not None:
+        bind["min_age"] = params.min_age
+    if params.max_age is not None:
+        bind["max_age"] = params.max_age
+    if params.name_prefix:
+        bind["name_from"] = params.name_prefix
+        if (name_to := prefix_upper_bound(params.name_prefix)) is not None:
+            bind["name_to"] = name_to
+    return bind
+
+### Keyset pagination ###
+
+# A cursor holds the sort key and id of the last hero on a page, base64
+# encoded so clients treat it as opaque. Seeking past it lets SQLite start
+# from that index entry instead of scanning and discarding offset rows.
+
+def encode_cursor(order_by: str, hero: Hero | HeroResponse) -> str:
+    key = [order_by, getattr(hero, order_by), hero.id]
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+# The sort value a cursor may carry for each order_by
+cursor_value_types = {
+    "id": lambda value, hero_id: type(value) is int and value == hero_id,
+    "name": lambda value, hero_id: type(value) is str,
+    "age": lambda value, hero_id: value is None or is_sqlite_int(value),
+}
+
+def decode_cursor(cursor: str, order_by: str) -> tuple[str | int | None, int]:
+    try:
+        cursor_order_by, value, hero_id = json.loads(base64.urlsafe_b64decode(cursor))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    # Anything else would only fail at bind time
+    if cursor_order_by != order_by or not is_sqlite_int(hero_id):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not cursor_value_types[order_by](value, hero_id):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return value, hero_id
+
+def seek_after(order_by: str):
+    # Bound to the "value" and "hero_id" parameters of the cursor
+    hero_id = bindparam("hero_id")
+    if order_by == "id":
+        return Hero.id > hero_id
+    column = getattr(Hero, order_by)
+    # The >= bound gives SQLite an index range to seek into
+    value = bindparam("value")
+    return and_(column >= value, or_(column > value, Hero.id > hero_id))
+
+def next_cursor(params: HeroListParams, heroes: list[HeroResponse]) -> str | None:
+    if not heroes or len(heroes) < params.limit:
+        return None
+    return encode_cursor(params.order_by, heroes[-1])
+
+### Hero read-through cache ###
+
+# Single heroes are cached by id and list pages by their query parameters.
+# Writes invalidate after they commit: creates and updates drop the pages and
+# cache the written hero straight away, deletes drop both caches. A hero only
+# replaces a cached one with a lower version, so when two updates of a hero
+# finish out of order the later version stays cached, and an update captures
+# the generation before it writes so a concurrent delete still wins.
+
+hero_cache = LRUCache(maxsize=10_000, ttl=60)
+hero_page_cache = LRUCache(maxsize=1_000, ttl=10)
+
+def newer_hero(cached: HeroRecord, hero: HeroRecord) -> bool:
+    return hero.version > cached.version
+
+### Hero statistics ###
+
+# The row count and age histogram are kept in memory and served in O(1).
+# Write paths record (age, +1/-1) deltas on their session and the deltas are
+# applied only once that session commits, so rolled-back writes never count.
+# A background job recounts from the database every few minutes to correct
+# drift (e.g. from writes by other processes).
+
+hero_stats = AgeStats(bucket_width=10)
+
+hero_stats_reconcile_interval = 300
+
+def record_hero_stats(session: Session, *deltas: tuple[int | None, int]) -> None:
+    session.info.setdefault("hero_stats", []).extend(deltas)
+
+def apply_hero_stats(session: Session) -> None:
+    hero_stats.apply(session.info.pop("hero_stats", []))
+
+def discard_hero_stats(session: Session) -> None:
+    session.info.pop("hero_stats", None)
+
+event.listen(Session, "after_commit", apply_hero_stats)
+event.listen(Session, "after_rollback", discard_hero_stats)
+
+def reconcile_hero_stats() -> None:
+    # On shards the per-shard counts simply add up in reset()
+    with make_session() as session:
+        age_counts = session.exec(select(Hero.age, func.count()).group_by(Hero.age)).all()
+    hero_stats.reset(age_counts)
+
+### Hero versions and ETags ###
+
+# Every write bumps hero.version. Single-hero responses carry it as a strong
+# ETag ("<id>.<version>"): If-None-Match on GET answers 304 without building a
+# body, and If-Match on PATCH/DELETE turns the write into a conditional one
+# that fails with 412 if someone else changed the hero in between. The tag is
+# only unique because hero ids are never handed out twice (AUTOINCREMENT).
+
+# create_all() does not add columns (or their indexes) to an existing table
+hero_migrations = {
+    "version": ["ALTER TABLE hero ADD COLUMN version INTEGER NOT NULL DEFAULT 1"],
+    "team_id": [
+        "ALTER TABLE hero ADD COLUMN team_id INTEGER REFERENCES team (id)",
+        "CREATE INDEX ix_hero_team_id ON hero (team_id)",
+    ],
+}
+
+def migrate_hero_table(target):
+    with target.begin() as connection:
+        columns = {row.name for row in connection.execute(text("PRAGMA table_info(hero)"))}
+        for column, statements in hero_migrations.items():
+            if column not in columns:
+                for statement in statements:
+                    connection.execute(text(statement))
+        hero_ddl = connection.execute(
+            text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'hero'")
+        ).scalar()
+        if "AUTOINCREMENT" not in hero_ddl:
+            rebuild_hero_table(connection)
+
+# SQLite cannot add AUTOINCREMENT to a table, so older databases get a copy
+# of hero built from the current DDL. Dropping the old table takes its
+# indexes and triggers along; the search triggers are restored by
+# create_hero_search_index(). Ids are copied as they are.
+def rebuild_hero_table(connection):
+    ddl = str(CreateTable(hero_table).compile(connection))
+    connection.execute(text(ddl.replace("CREATE TABLE hero ", "CREATE TABLE hero_new ", 1)))
+    columns = ", ".join(column.name for column in hero_table.columns)
+    connection.execute(text(f"INSERT INTO hero_new ({columns}) SELECT {columns} FROM hero"))
+    connection.execute(text("DROP TABLE hero"))
+    connection.execute(text("ALTER TABLE hero_new RENAME TO hero"))
+    for index in hero_table.indexes:
+        index.create(connection)
+
+def hero_etag(hero: HeroRecord) -> str:
+    return f'"{hero.id}.{hero.version}"'
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    # If-None-Match uses the weak comparison, so W/ prefixes are ignored
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+def if_match_versions(if_match: str | None, hero_id: int) -> list[int] | None:
+    # None means the write is unconditional
+    if if_match is None:
+        return None
+    versions = []
+    for tag in if_match.split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return None
+        tag_id, _, version = tag.strip('"').partition(".")
+        if tag.startswith('"') and tag_id == str(hero_id) and version.isdecimal():
+            if int(version) <= sqlite_int_max:
+                versions.append(int(version))
+    if not versions:
+        raise HTTPException(status_code=412, detail="Hero version does not match")
+    return versions
+
+def conditional_hero(
+    hero: HeroRecord, if_none_match: str | None, response: Response
+) -> HeroRecord | Response:
+    etag = hero_etag(hero)
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return hero
+
+### Pre-built hero statements ###
+
+# Every hero statement is built once per shape with bound parameters and then
+# reused. SQLAlchemy memoizes the cache key on the statement object, so later
+# executions skip statement construction and cache-key generation and go
+# straight to the compiled cache; only the parameter values change.
+
+hero_by_id = select(Hero).where(Hero.id == bindparam("hero_id"))
+
+hero_state_by_id = select(Hero.id, Hero.age, Hero.version).where(
+    Hero.id == bindparam("hero_id")
+)
+
+hero_insert = insert(Hero).returning(Hero)
+
+# Powers go with their hero. Unsharded, a trigger does it inside the hero
+# DELETE so a delete stays one statement; shards cannot see the power
+# table, so there delete_hero_powers() runs explicitly.
+hero_powers_trigger = """CREATE TRIGGER IF NOT EXISTS hero_powers_delete AFTER DELETE ON hero BEGIN
+    DELETE FROM power WHERE hero_id = old.id;
+END"""
+
+hero_powers_delete = (
+    delete(Power)
+    .where(Power.hero_id.in_(bindparam("hero_ids", expanding=True)))
+    .execution_options(synchronize_session=False, chunked=True)
+)
+
+hero_table = Hero.__table__
+
+# Round-robin over the shards for new heroes
+next_hero_shard = itertools.cycle(hero_shards).__next__
+
+# Maintained by SQLite for AUTOINCREMENT tables
+sqlite_sequence = sql_table("sqlite_sequence", sql_column("name"), sql_column("seq"))
+
+@functools.cache
+def hero_shard_insert(shard: str, returning: bool = True):
+    # The next id of the shard is computed inside the INSERT, which already
+    # holds the shard's write lock. It follows the shard's AUTOINCREMENT
+    # high-water mark rather than max(id), so deleted ids are not reused.
+    # A Core insert, because ORM bulk inserts cannot be routed by
+    # ShardedSession.
+    first_id = int(shard) + 1
+    high_water = (
+        select(sqlite_sequence.c.seq + hero_shard_count)
+        .where(sqlite_sequence.c.name == "hero")
+        .scalar_subquery()
+    )
+    next_id = func.coalesce(high_water, first_id)
+    statement = insert(hero_table).from_select(
+        ["id", "name", "age", "team_id", "secret_name"],
+        select(
+            next_id,
+            bindparam("name"),
+            bindparam("age"),
+            bindparam("team_id"),
+            bindparam("secret_name"),
+        ),
+    )
+    if returning:
+        statement = statement.returning(*hero_table.c)
+    return statement
+
+def where_hero(statement, conditional: bool):
+    statement = statement.where(Hero.id == bindparam("hero_id"))
+    if conditional:
+        statement = statement.where(Hero.version.in_(bindparam("versions", expanding=True)))
+    return statement
+
+@functools.cache
+def hero_delete(conditional: bool):
+    return (
+        where_hero(delete(Hero), conditional)
+        .returning(Hero.age)
+        .execution_options(synchronize_session=False)
+    )
+
+@functools.cache
+def hero_update(columns: tuple[str, ...], conditional: bool):
+    # SET parameters are prefixed because bare column names are reserved
+    values = {column: bindparam(f"new_{column}") for column in columns}
+    values["version"] = Hero.version + 1
+    return (
+        where_hero(update(Hero), conditional)
+        .values(values)
+        .returning(Hero)
+        .execution_options(synchronize_session=False)
+    )
+
+@functools.cache
+def hero_page(
+    order_by: str, seek: bool, value_is_null: bool = False, filters: tuple[str, ...] = ()
+):
+    # Plain rows in HeroResponse field order; no ORM objects to build
+    statement = select(Hero.name, Hero.age, Hero.team_id, Hero.id)
+    for name in filters:
+        statement = statement.where(hero_filters[name])
+    order = [Hero.id] if order_by == "id" else [getattr(Hero, order_by), Hero.id]
+    if filters and order_by not in {hero_filter_columns[name] for name in filters}:
+        order = [unindexed(column) for column in order]
+    if seek and value_is_null:
+        return seek_after_null(statement, order_by, order)
+    statement = statement.order_by(*order)
+    if seek:
+        statement = statement.where(seek_after(order_by))
+    else:
+        statement = statement.offset(bindparam("offset"))
+    return statement.limit(bindparam("limit"))
+
+def seek_after_null(statement, order_by: str, order: list):
+    # SQLite sorts NULL ages first, so the page after a NULL cursor is the
+    # rest of the NULL run followed by every non-NULL age. As one OR that
+    # walks ix_hero_age from the start; as two index searches of at most one
+    # page each it does not, and only those rows are sorted together.
+    column = getattr(Hero, order_by)
+    limit = bindparam("limit")
+    nulls = statement.where(column.is_(None), Hero.id > bindparam("hero_id"))
+    rest = statement.where(column.is_not(None))
+    page = union_all(
+        select(nulls.order_by(Hero.id).limit(limit).subquery()),
+        select(rest.order_by(*order).limit(limit).subquery()),
+    ).subquery()
+    return select(*page.c).order_by(page.c[order_by], page.c.id).limit(limit)
+
+### Fast hero list serialization ###
+
+# With HEROES_FAST_JSON=1 the hero list is built without validating rows and
+# serialized in one pass by a prebuilt TypeAdapter, instead of FastAPI
+# validating every HeroResponse again against the response_model and encoding
+# it through jsonable_encoder + json.dumps. The bytes are the same as the
+# default JSONResponse output.
+
+use_fast_json = os.getenv("HEROES_FAST_JSON", "0") == "1"
+
+hero_list_adapter = TypeAdapter(list[HeroResponse])
+
+def hero_list_response(heroes: list[HeroResponse], response: Response):
+    if not use_fast_json:
+        return heroes
+    # A returned Response does not pick up headers set on the injected one
+    return Response(
+        content=hero_list_adapter.dump_json(heroes),
+        media_type="application/json",
+        headers=response.headers,
+    )
+
+### Hero data access ###
+
+# The queries are shared by both engine modes: the sync routes call these
+# directly and the async routes run them on the AsyncSession with run_sync.
+#
+# Each write is a single INSERT/UPDATE/DELETE ... RETURNING statement, so the
+# generated id and final column values come back with the write itself
+# instead of a session.get() before it and a session.refresh() after the
+# commit. The stage_* functions run that statement without committing, which
+# lets the group-commit writer below batch them.
+
+def hero_write_failed(session: Session, hero_id: int, versions: list[int] | None):
+    # A conditional write that matched nothing is a 412 if the hero exists
+    if versions is not None:
+        if session.exec(
+            hero_state_by_id, params={"hero_id": hero_id}, execution_options=on_heroes([hero_id])
+        ).first():
+            return HTTPException(status_code=412, detail="Hero version does not match")
+    return HTTPException(status_code=404, detail="Hero not found")
+
+def stage_hero_create(session: Session, hero: HeroCreate) -> HeroRecord:
+    if use_shards:
+        shard = next_hero_shard()
+        hero_db = session.exec(
+            hero_shard_insert(shard),
+            params=hero.model_dump(),
+            bind_arguments={"shard_id": shard},
+        ).one()
+    else:
+        hero_db = session.exec(hero_insert, params=[hero.model_dump()]).scalar_one()
+    db_hero = HeroRecord.model_validate(hero_db)
+    record_hero_stats(session, (db_hero.age, 1))
+    return db_hero
+
+def stage_hero_update(
+    session: Session, hero_id: int, hero: HeroUpdate, versions: list[int] | None = None
+) -> HeroRecord:
+    hero_data = hero.model_dump(exclude_unset=True)
+    if not hero_data:
+        current = get_hero(session, hero_id)
+        if versions is not None and current.version not in versions:
+            raise HTTPException(status_code=412, detail="Hero version does not match")
+        return current
+    columns = tuple(sorted(hero_data))
+    params = {f"new_{column}": value for column, value in hero_data.items()}
+    params["hero_id"] = hero_id
+    hero_db = old = None
+    if "age" in hero_data:
+        # RETURNING only sees the new row, so the stats need the old age from
+        # elsewhere. A cached hero is exact if the UPDATE still matches its
+        # version, which keeps the write one statement; otherwise the row is
+        # read before it is written.
+        cached = hero_cache.get(hero_id)
+        if cached is not None and (versions is None or cached.version in versions):
+            hero_db = session.exec(
+                hero_update(columns, True),
+                params={**params, "versions": [cached.version]},
+                execution_options=on_heroes([hero_id]),
+            ).scalar_one_or_none()
+            old = cached if hero_db else None
+        if hero_db is None:
+            old = session.exec(
+                hero_state_by_id, params={"hero_id": hero_id}, execution_options=on_heroes([hero_id])
+            ).one_or_none()
+            if old is None:
+                raise HTTPException(status_code=404, detail="Hero not found")
+    if hero_db is None:
+        if versions is not None:
+            params["versions"] = versions
+        statement = hero_update(columns, versions is not None)
+        hero_db = session.exec(
+            statement, params=params, execution_options=on_heroes([hero_id])
+        ).scalar_one_or_none()
+        if not hero_db:
+            raise hero_write_failed(session, hero_id, versions)
+    if old is not None:
+        record_hero_stats(session, (old.age, -1), (hero_db.age, 1))
+    return HeroRecord.model_validate(hero_db)
+
+def stage_hero_delete(
+    session: Session, hero_id: int, versions: list[int] | None = None
+) -> None:
+    params = {"hero_id": hero_id}
+    if versions is not None:
+        params["versions"] = versions
+    deleted = session.exec(
+        hero_delete(versions is not None), params=params, execution_options=on_heroes([hero_id])
+    ).one_or_none()
+    if deleted is None:
+        raise hero_write_failed(session, hero_id, versions)
+    if use_shards:
+        delete_hero_powers(session, [hero_id])
+    record_hero_stats(session, (deleted.age, -1))
+
+def delete_hero_powers(session: Session, hero_ids: list[int]) -> None:
+    # SQLite does not cascade without foreign keys
+    for chunk in itertools.batched(hero_ids, bulk_chunk_size):
+        session.exec(hero_powers_delete, params={"hero_ids": list(chunk)})
+
+def add_hero(session: Session, hero: HeroCreate) -> HeroRecord:
+    db_hero = stage_hero_create(session, hero)
     session.commit()
-    session.refresh(db_hero)
+    hero_page_cache.invalidate()
+    hero_cache.set(db_hero.id, db_hero)
     return db_hero
 
-### Read Heroes with the new models ###
+def get_hero(session: Session, hero_id: int) -> HeroRecord:
+    generation = hero_cache.generation
+    hero = hero_cache.get(hero_id)
+    if hero is None:
+        hero_db = session.exec(
+            hero_by_id, params={"hero_id": hero_id}, execution_options=on_heroes([hero_id])
+        ).first()
+        if not hero_db:
+            raise HTTPException(status_code=404, detail="Hero not found")
+        hero = HeroRecord.model_validate(hero_db)
+        hero_cache.set(hero_id, hero, generation, newer=newer_hero)
+    return hero
 
-@router.get("/heroes/", response_model=list[HeroResponse])
-def read_heroes(
-    session: SessionDependency,
-    offset: int = 0,
-    limit: Annotated[int, Query(le=100)] = 100
-):
-    heroes = session.exec(select(Hero).offset(offset).limit(limit)).all()
+def list_heroes(session: Session, params: HeroListParams) -> list[HeroResponse]:
+    key = tuple(params.model_dump().values())
+    generation = hero_page_cache.generation
+    heroes = hero_page_cache.get(key)
+    if heroes is None:
+        heroes = query_heroes(session, params)
+        hero_page_cache.set(key, heroes, generation)
     return heroes
 
-### Update a Hero by ID with the new models ###
-@router.patch("/heroes/{hero_id}", response_model=HeroResponse)
-def update_hero(hero_id: int, hero: HeroUpdate, session: SessionDependency):
-    hero_db = session.get(Hero, hero_id)
-    if not hero_db:
-        raise HTTPException(status_code=404, detail="Hero not found")
-    hero_data = hero.model_dump(exclude_unset=True)
-    hero_db.sqlmodel_update(hero_data)
-    session.add(hero_db)
+def query_heroes(session: Session, params: HeroListParams) -> list[HeroResponse]:
+    bind = hero_filter_params(params)
+    filters = tuple(bind)
+    bind["limit"] = params.limit
+    if params.cursor:
+        if params.offset:
+            raise HTTPException(status_code=400, detail="Use either offset or cursor")
+        value, hero_id = decode_cursor(params.cursor, params.order_by)
+        statement = hero_page(
+            params.order_by, seek=True, value_is_null=value is None, filters=filters
+        )
+        bind.update(value=value, hero_id=hero_id)
+    else:
+        statement = hero_page(params.order_by, seek=False, filters=filters)
+        bind.update(offset=params.offset)
+    if use_shards:
+        rows = query_shard_pages(session, statement, bind, hero_sort_key(params.order_by))
+    else:
+        rows = session.exec(statement, params=bind).all()
+    if use_fast_json:
+        # Values come straight from typed columns, so skip validation
+        return [HeroResponse.model_construct(**row._mapping) for row in rows]
+    return [HeroResponse.model_validate(row) for row in rows]
+
+def hero_sort_key(order_by: str):
+    # Matches hero_page's ORDER BY, with SQLite putting NULL ages first
+    if order_by == "id":
+        return lambda row: row.id
+    if order_by == "name":
+        return lambda row: (row.name, row.id)
+    return lambda row: (row.age is not None, row.age or 0, row.id)
+
+def query_shard_pages(session: Session, statement, bind: dict, key) -> list:
+    offset = bind.get("offset", 0)
+    shard_bind = {**bind, "limit": offset + bind["limit"]}
+    if "offset" in bind:
+        shard_bind["offset"] = 0
+    shard_rows = [
+        session.exec(statement, params=shard_bind, bind_arguments={"shard_id": shard}).all()
+        for shard in hero_shards
+    ]
+    return merge_shard_rows(shard_rows, key, offset, bind["limit"])
+
+def change_hero(
+    session: Session, hero_id: int, hero: HeroUpdate, versions: list[int] | None = None
+) -> HeroRecord:
+    generation = hero_cache.generation
+    hero_db = stage_hero_update(session, hero_id, hero, versions)
     session.commit()
-    session.refresh(hero_db)
+    hero_page_cache.invalidate()
+    hero_cache.set(hero_id, hero_db, generation, newer=newer_hero)
     return hero_db
 
-### Delete a Hero by ID with the new models ###
+def remove_hero(session: Session, hero_id: int, versions: list[int] | None = None) -> None:
+    stage_hero_delete(session, hero_id, versions)
+    session.commit()
+    hero_page_cache.invalidate()
+    hero_cache.invalidate()
+
+### Group-commit write queue ###
+
+# With HEROES_WRITE_QUEUE=1 hero creates, updates and deletes go through a
+# single writer thread that commits the stage_* writes above in small batches
+# (see database/write_queue.py) and then drops the caches.
+
+use_write_queue = os.getenv("HEROES_WRITE_QUEUE", "0") == "1"
+
+def invalidate_hero_caches() -> None:
+    hero_page_cache.invalidate()
+    hero_cache.invalidate()
+
+hero_writer = GroupCommitWriter(make_session, after_commit=invalidate_hero_caches)
+
+if not use_async_engine:
+
+    #### Create a Hero with the new models ###
+
+    @router.post("/heroes/", response_model=HeroResponse)
+    def create_hero(hero: HeroCreate, session: SessionDependency):
+        if use_write_queue:
+            return hero_writer.submit(stage_hero_create, hero).result()
+        return add_hero(session, hero)
+
+    ### Read Heroes with the new models ###
+
+    # Pages by offset by default. Full pages carry an X-Next-Cursor header;
+    # passing it back as ?cursor= switches to keyset pagination.
+
+    @router.get("/heroes/", response_model=list[HeroResponse])
+    def read_heroes(
+        session: ReadSessionDependency,
+        params: Annotated[HeroListParams, Query()],
+        response: Response,
+    ):
+        heroes = list_heroes(session, params)
+        if cursor := next_cursor(params, heroes):
+            response.headers["X-Next-Cursor"] = cursor
+        # The running total only covers the unfiltered list
+        if not hero_filter_params(params):
+            response.headers["X-Total-Count"] = str(hero_stats.total)
+        return hero_list_response(heroes, response)
+
+    ### Read one Hero by ID with the new models ###
+
+    # {hero_id:int} keeps static paths such as /heroes/export from matching
+
+    @router.get("/heroes/{hero_id:int}", response_model=HeroResponse)
+    def read_hero(
+        hero_id: IdPath,
+        session: ReadSessionDependency,
+        response: Response,
+        if_none_match: Annotated[str | None, Header()] = None,
+    ):
+        return conditional_hero(get_hero(session, hero_id), if_none_match, response)
+
+    ### Update a Hero by ID with the new models ###
+
+    @router.patch("/heroes/{hero_id:int}", response_model=HeroResponse)
+    def update_hero(
+        hero_id: IdPath,
+        hero: HeroUpdate,
+        session: SessionDependency,
+        response: Response,
+        if_match: Annotated[str | None, Header()] = None,
+    ):
+        versions = if_match_versions(if_match, hero_id)
+        if use_write_queue:
+            hero_db = hero_writer.submit(stage_hero_update, hero_id, hero, versions).result()
+        else:
+            hero_db = change_hero(session, hero_id, hero, versions)
+        response.headers["ETag"] = hero_etag(hero_db)
+        return hero_db
+
+    ### Delete a Hero by ID with the new models ###
+
+    @router.delete("/heroes/{hero_id:int}")
+    def delete_hero(
+        hero_id: IdPath,
+        session: SessionDependency,
+        if_match: Annotated[str | None, Header()] = None,
+    ):
+        versions = if_match_versions(if_match, hero_id)
+        if use_write_queue:
+            hero_writer.submit(stage_hero_delete, hero_id, versions).result()
+        else:
+            remove_hero(session, hero_id, versions)
+        return {"ok": True}
+
+else:
+
+    ### Async versions of the hero routes ###
+
+    @router.post("/heroes/", response_model=HeroResponse)
+    async def create_hero(hero: HeroCreate, session: AsyncSessionDependency):
+        if use_write_queue:
+            return await asyncio.wrap_future(hero_writer.submit(stage_hero_create, hero))
+        return await session.run_sync(add_hero, hero)
+
+    @router.get("/heroes/", response_model=list[HeroResponse])
+    async def read_heroes(
+        session: AsyncReadSessionDependency,
+        params: Annotated[HeroListParams, Query()],
+        response: Response,
+    ):
+        heroes = await session.run_sync(list_heroes, params)
+        if cursor := next_cursor(params, heroes):
+            response.headers["X-Next-Cursor"] = cursor
+        # The running total only covers the unfiltered list
+        if not hero_filter_params(params):
+            response.headers["X-Total-Count"] = str(hero_stats.total)
+        return hero_list_response(heroes, response)
+
+    @router.get("/heroes/{hero_id:int}", response_model=HeroResponse)
+    async def read_hero(
+        hero_id: IdPath,
+        session: AsyncReadSessionDependency,
+        response: Response,
+        if_none_match: Annotated[str | None, Header()] = None,
+    ):
+        hero = await session.run_sync(get_hero, hero_id)
+        return conditional_hero(hero, if_none_match, response)
+
+    @router.patch("/heroes/{hero_id:int}", response_model=HeroResponse)
+    async def update_hero(
+        hero_id: IdPath,
+        hero: HeroUpdate,
+        session: AsyncSessionDependency,
+        response: Response,
+        if_match: Annotated[str | None, Header()] = None,
+    ):
+        versions = if_match_versions(if_match, hero_id)
+        if use_write_queue:
+            future = hero_writer.submit(stage_hero_update, hero_id, hero, versions)
+            hero_db = await asyncio.wrap_future(future)
+        else:
+            hero_db = await session.run_sync(change_hero, hero_id, hero, versions)
+        response.headers["ETag"] = hero_etag(hero_db)
+        return hero_db
+
+    @router.delete("/heroes/{hero_id:int}")
+    async def delete_hero(
+        hero_id: IdPath,
+        session: AsyncSessionDependency,
+        if_match: Annotated[str | None, Header()] = None,
+    ):
+        versions = if_match_versions(if_match, hero_id)
+        if use_write_queue:
+            future = hero_writer.submit(stage_hero_delete, hero_id, versions)
+            await asyncio.wrap_future(future)
+        else:
+            await session.run_sync(remove_hero, hero_id, versions)
+        return {"ok": True}
+
+
+### Bulk hero ingestion ###
+
+# POST /heroes/bulk takes a JSON array, or an NDJSON stream when sent as
+# application/x-ndjson. Rows are validated one by one and inserted with a
+# single executemany per chunk, each chunk in its own transaction, so one bad
+# row is reported instead of aborting the whole load.
+
+bulk_chunk_size = 1000
 
-@router.delete("/heroes/{hero_id}")
-def delete_hero(hero_id: int, session: SessionDependency):
-    hero = session.get(Hero, hero_id)
-    if not hero:
+async def read_bulk_rows(request: Request):
+    if request.headers.get("content-type", "").startswith("application/x-ndjson"):
+        buffer = b""
+        async for chunk in request.stream():
+            *lines, buffer = (buffer + chunk).split(b"\n")
+            for line in lines:
+                if line.strip():
+                    yield line
+        if buffer.strip():
+            yield buffer
+        return
+    try:
+        rows = json.loads(await request.body())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Body must be a JSON array")
+    if not isinstance(rows, list):
+        raise HTTPException(status_code=400, detail="Body must be a JSON array")
+    for row in rows:
+        yield row
+
+def validate_bulk_row(row: bytes | dict) -> HeroCreate:
+    if isinstance(row, bytes):
+        return HeroCreate.model_validate_json(row)
+    return HeroCreate.model_validate(row)
+
+def insert_hero_rows(session: Session, batch: list[tuple[int, dict]]) -> list[dict]:
+    try:
+        if use_shards:
+            insert_shard_rows(session, [data for _, data in batch])
+        else:
+            # A Core insert: the ORM one leaves out None values and splits the
+            # batch wherever the set of present columns changes
+            session.execute(insert(hero_table), [data for _, data in batch])
+        record_hero_stats(session, *((data["age"], 1) for _, data in batch))
+        session.commit()
+    except DBAPIError as exc:
+        session.rollback()
+        return [{"row": index, "errors": [str(exc.orig)]} for index, _ in batch]
+    hero_page_cache.invalidate()
+    return []
+
+def insert_shard_rows(session: Session, rows: list[dict]) -> None:
+    rows_by_shard: dict[str, list[dict]] = {}
+    for data in rows:
+        rows_by_shard.setdefault(next_hero_shard(), []).append(data)
+    for shard, shard_rows in rows_by_shard.items():
+        session.execute(
+            hero_shard_insert(shard, returning=False),
+            shard_rows,
+            bind_arguments={"shard_id": shard},
+        )
+
+@router.post("/heroes/bulk")
+async def create_heroes_bulk(request: Request, session: SessionDependency):
+    inserted = 0
+    errors = []
+    batch = []
+
+    async def flush():
+        nonlocal inserted, batch
+        failed = await run_in_threadpool(insert_hero_rows, session, batch)
+        inserted += len(batch) - len(failed)
+        errors.extend(failed)
+        batch = []
+
+    index = 0
+    async for row in read_bulk_rows(request):
+        try:
+            batch.append((index, validate_bulk_row(row).model_dump()))
+        except ValidationError as exc:
+            errors.append({
+                "row": index,
+                "errors": exc.errors(include_url=False, include_context=False),
+            })
+        index += 1
+        if len(batch) >= bulk_chunk_size:
+            await flush()
+    if batch:
+        await flush()
+    return {"received": index, "inserted": inserted, "errors": errors}
+
+
+### Batch hero updates and filtered deletes ###
+
+# PATCH /heroes/batch applies up to bulk_chunk_size partial updates in one
+# transaction: one SELECT for the current rows, then a single UPDATE whose
+# SET clauses are CASE expressions over the hero ids. The UPDATE only matches
+# rows still at the version the SELECT saw, so a write that lands in between
+# is never overwritten; those rows are read and tried again. DELETE /heroes/ with
+# filters removes every matching hero with one DELETE ... RETURNING. Both
+# report per-id outcomes and go through the write queue when it is enabled.
+
+hero_batch_attempts = 3
+
+hero_states_by_ids = select(Hero.id, Hero.age, Hero.version).where(
+    Hero.id.in_(bindparam("hero_ids", expanding=True))
+)
+
+# Columns a partial update may not set to null
+hero_required_columns = {
+    column.name for column in Hero.__table__.columns if not column.nullable
+}
+
+def hero_batch_update(changes: dict[int, dict], versions: dict[int, int]):
+    columns = sorted({column for data in changes.values() for column in data})
+    values = {
+        column: case(
+            {hero_id: data[column] for hero_id, data in changes.items() if column in data},
+            value=Hero.id,
+            else_=getattr(Hero, column),
+        )
+        for column in columns
+    }
+    values["version"] = Hero.version + 1
+    return (
+        update(Hero)
+        .where(
+            Hero.id.in_(bindparam("hero_ids", expanding=True)),
+            Hero.version == case(versions, value=Hero.id, else_=Hero.version),
+        )
+        .values(values)
+        .returning(Hero.id, Hero.age, Hero.version)
+        .execution_options(synchronize_session=False)
+    )
+
+@functools.cache
+def hero_filtered_delete(age_lt: bool, name: bool):
+    statement = delete(Hero)
+    if age_lt:
+        statement = statement.where(Hero.age < bindparam("age_lt"))
+    if name:
+        statement = statement.where(Hero.name == bindparam("name"))
+    return statement.returning(Hero.id, Hero.age).execution_options(
+        synchronize_session=False
+    )
+
+def stage_hero_batch_update(session: Session, heroes: list[HeroBatchUpdate]) -> dict:
+    ids = [hero.id for hero in heroes]
+    if len(set(ids)) != len(ids):
+        raise HTTPException(status_code=400, detail="Duplicate hero id in batch")
+    results = {}
+    pending = []
+    for hero in heroes:
+        data = hero.model_dump(exclude_unset=True, exclude={"id", "version"})
+        if hero_required_columns.intersection(
+            column for column, value in data.items() if value is None
+        ):
+            results[hero.id] = {"id": hero.id, "status": "invalid"}
+        else:
+            pending.append((hero, data))
+    updated = 0
+    for attempt in range(hero_batch_attempts):
+        if not pending:
+            break
+        pending_ids = [hero.id for hero, _ in pending]
+        current = {
+            row.id: row
+            for row in session.exec(
+                hero_states_by_ids,
+                params={"hero_ids": pending_ids},
+                execution_options=on_heroes(pending_ids),
+            )
+        }
+        changes = {}
+        for hero, data in pending:
+            row = current.get(hero.id)
+            if row is None:
+                results[hero.id] = {"id": hero.id, "status": "not_found"}
+            elif hero.version is not None and hero.version != row.version:
+                results[hero.id] = {"id": hero.id, "status": "conflict", "version": row.version}
+            elif data:
+                changes[hero.id] = data
+            else:
+                results[hero.id] = {"id": hero.id, "status": "unchanged", "version": row.version}
+        if not changes:
+            break
+        versions = {hero_id: current[hero_id].version for hero_id in changes}
+        statement = hero_batch_update(changes, versions)
+        rows = session.exec(
+            statement, params={"hero_ids": list(changes)}, execution_options=on_heroes(changes)
+        )
+        for row in rows:
+            updated += 1
+            results[row.id] = {"id": row.id, "status": "updated", "version": row.version}
+            if "age" in changes[row.id]:
+                # The row was still at the version we read, so this is its old age
+                record_hero_stats(session, (current[row.id].age, -1), (row.age, 1))
+        pending = [(hero, data) for hero, data in pending if hero.id in changes and hero.id not in results]
+    # Rows that kept changing under us on every attempt
+    for hero, _ in pending:
+        results.setdefault(hero.id, {"id": hero.id, "status": "conflict"})
+    return {
+        "updated": updated,
+        "results": [results[hero_id] for hero_id in ids],
+    }
+
+def stage_hero_filtered_delete(session: Session, age_lt: int | None, name: str | None) -> dict:
+    statement = hero_filtered_delete(age_lt is not None, name is not None)
+    deleted = session.exec(statement, params={"age_lt": age_lt, "name": name}).all()
+    if use_shards:
+        delete_hero_powers(session, [row.id for row in deleted])
+    record_hero_stats(session, *((row.age, -1) for row in deleted))
+    return {"deleted": len(deleted), "ids": [row.id for row in deleted]}
+
+def run_hero_batch(session: Session, operation, *args) -> dict:
+    if use_write_queue:
+        return hero_writer.submit(operation, *args).result()
+    result = operation(session, *args)
+    session.commit()
+    invalidate_hero_caches()
+    return result
+
+@router.patch("/heroes/batch")
+def update_heroes_batch(
+    heroes: Annotated[list[HeroBatchUpdate], Body(max_length=bulk_chunk_size)],
+    session: SessionDependency,
+):
+    return run_hero_batch(session, stage_hero_batch_update, heroes)
+
+@router.delete("/heroes/")
+def delete_heroes(
+    session: SessionDependency,
+    age_lt: Annotated[int | None, Query(**sqlite_int_bounds)] = None,
+    name: str | None = None,
+):
+    # Refuse to empty the whole table by accident
+    if age_lt is None and name is None:
+        raise HTTPException(status_code=400, detail="Pass age_lt and/or name")
+    return run_hero_batch(session, stage_hero_filtered_delete, age_lt, name)
+
+
+### Teams, powers and heroes with relations ###
+
+# Relations are loaded eagerly with a fixed number of statements per page,
+# never lazily per row. Many-to-one (hero -> team) uses joinedload, a LEFT
+# JOIN in the page query itself. One-to-many (hero -> powers, team ->
+# heroes) uses selectinload, one extra SELECT ... WHERE IN (page keys),
+# because joining a collection multiplies rows and breaks LIMIT. Shards
+# cannot join to database.db, so there the team is a selectinload as well.
+
+hero_team_loader = selectinload(Hero.team) if use_shards else joinedload(Hero.team)
+
+hero_details_page = (
+    select(Hero)
+    .options(hero_team_loader, selectinload(Hero.powers))
+    .order_by(Hero.id)
+    .offset(bindparam("offset"))
+    .limit(bindparam("limit"))
+)
+
+team_page = (
+    select(Team)
+    .options(selectinload(Team.heroes))
+    .order_by(Team.id)
+    .offset(bindparam("offset"))
+    .limit(bindparam("limit"))
+)
+
+@router.get("/heroes/details", response_model=list[HeroResponseWithTeam])
+def read_hero_details(
+    session: ReadSessionDependency,
+    offset: OffsetQuery = 0,
+    limit: Annotated[int, Query(ge=0, le=100)] = 100,
+):
+    bind = {"offset": offset, "limit": limit}
+    if use_shards:
+        return query_shard_pages(session, hero_details_page, bind, hero_sort_key("id"))
+    return session.exec(hero_details_page, params=bind).all()
+
+@router.post("/heroes/{hero_id:int}/powers", response_model=PowerResponse)
+def create_power(hero_id: IdPath, power: PowerCreate, session: SessionDependency):
+    if session.exec(
+        hero_state_by_id, params={"hero_id": hero_id}, execution_options=on_heroes([hero_id])
+    ).first() is None:
         raise HTTPException(status_code=404, detail="Hero not found")
-    session.delete(hero)
+    db_power = Power.model_validate(power, update={"hero_id": hero_id})
+    session.add(db_power)
+    session.commit()
+    session.refresh(db_power)
+    return db_power
+
+@router.post("/teams/", response_model=TeamResponse)
+def create_team(team: TeamCreate, session: SessionDependency):
+    db_team = Team.model_validate(team)
+    session.add(db_team)
     session.commit()
-    return {"ok": True}
\ No newline at end of file
+    session.refresh(db_team)
+    return db_team
+
+@router.get("/teams/", response_model=list[TeamResponseWithHeroes])
+def read_teams(
+    session: ReadSessionDependency,
+    offset: OffsetQuery = 0,
+    limit: Annotated[int, Query(ge=0, le=100)] = 100,
+):
+    return session.exec(team_page, params={"offset": offset, "limit": limit}).all()
+
+@router.get("/teams/{team_id:int}", response_model=TeamResponseWithHeroes)
+def read_team(team_id: IdPath, session: ReadSessionDependency):
+    team = session.get(Team, team_id, options=[selectinload(Team.heroes)])
+    if not team:
+        raise HTTPException(status_code=404, detail="Team not found")
+    return team
+
+
+### Streaming hero export ###
+
+# GET /heroes/export streams the public hero columns as NDJSON or CSV. Rows
+# are fetched yield_per at a time and each batch is written out before the
+# next one is read, so memory stays flat however large the table is. The
+# session lives inside the generator because the response outlives the
+# request's dependencies.
+
+export_batch_size = 1000
+
+export_media_types = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+def export_heroes(format: str):
+    statement = (
+        select(Hero.id, Hero.name, Hero.age, Hero.team_id)
+        .order_by(Hero.id)
+        .execution_options(yield_per=export_batch_size)
+    )
+    with make_read_session() as session:
+        if use_shards:
+            results = [
+                session.exec(statement, bind_arguments={"shard_id": shard})
+                for shard in hero_shards
+            ]
+            merged = heapq.merge(*results, key=lambda row: row.id)
+            batches = itertools.batched(merged, export_batch_size)
+        else:
+            batches = session.exec(statement).partitions()
+        if format == "csv":
+            yield "id,name,age,team_id\r\n"
+        for rows in batches:
+            if format == "csv":
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(rows)
+                yield buffer.getvalue()
+            else:
+                yield "".join(json.dumps(row._asdict()) + "\n" for row in rows)
+
+@router.get("/heroes/export")
+def read_heroes_export(format: Literal["ndjson", "csv"] = "ndjson"):
+    return StreamingResponse(export_heroes(format), media_type=export_media_types[format])
+
+
+### Hero cache statistics ###
+
+@router.get("/heroes/cache")
+def read_hero_cache_stats():
+    return {"heroes": hero_cache.stats(), "pages": hero_page_cache.stats()}
+
+
+### Full-text hero search ###
+
+# hero_fts is an FTS5 index over hero.name. It is an external-content table,
+# so it stores only the index and reads names back from hero, and the
+# triggers keep it in sync with every write path, including bulk inserts.
+# The index is filled from existing rows the first time it is created.
+
+hero_search_ddl = [
+    """CREATE VIRTUAL TABLE hero_fts USING fts5(
+        name, content='hero', content_rowid='id'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS hero_fts_insert AFTER INSERT ON hero BEGIN
+        INSERT INTO hero_fts(rowid, name) VALUES (new.id, new.name);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS hero_fts_delete AFTER DELETE ON hero BEGIN
+        INSERT INTO hero_fts(hero_fts, rowid, name) VALUES ('delete', old.id, old.name);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS hero_fts_update AFTER UPDATE OF name ON hero BEGIN
+        INSERT INTO hero_fts(hero_fts, rowid, name) VALUES ('delete', old.id, old.name);
+        INSERT INTO hero_fts(rowid, name) VALUES (new.id, new.name);
+    END""",
+]
+
+def create_hero_search_index(target):
+    with target.begin() as connection:
+        exists = connection.execute(
+            text("SELECT 1 FROM sqlite_master WHERE name = 'hero_fts'")
+        ).first()
+        if exists:
+            # The triggers go missing when rebuild_hero_table() replaces hero
+            for ddl in hero_search_ddl[1:]:
+                connection.execute(text(ddl))
+            return
+        for ddl in hero_search_ddl:
+            connection.execute(text(ddl))
+        connection.execute(text("INSERT INTO hero_fts(hero_fts) VALUES ('rebuild')"))
+
+hero_search_query = text("""
+    SELECT hero.id, hero.name, hero.age, hero.team_id, bm25(hero_fts) AS rank
+    FROM hero_fts JOIN hero ON hero.id = hero_fts.rowid
+    WHERE hero_fts MATCH :match
+    ORDER BY bm25(hero_fts)
+    LIMIT :limit OFFSET :offset
+""")
+
+def fts_match_expression(q: str) -> str | None:
+    # Every word becomes a quoted prefix term, so user input can never be
+    # parsed as FTS5 query syntax
+    words = re.findall(r"\w+", q)
+    if not words:
+        return None
+    return " ".join(f'"{word}"*' for word in words)
+
+@router.get("/heroes/search", response_model=list[HeroResponse])
+def search_heroes(
+    session: ReadSessionDependency,
+    q: Annotated[str, Query(min_length=1, max_length=200)],
+    offset: OffsetQuery = 0,
+    limit: Annotated[int, Query(ge=0, le=100)] = 20,
+):
+    match = fts_match_expression(q)
+    if match is None:
+        return []
+    bind = {"match": match, "limit": limit, "offset": offset}
+    if use_shards:
+        # bm25 scores each shard against its own corpus, so ranks across
+        # shards are close to, not exactly, the single-file order
+        rows = query_shard_pages(session, hero_search_query, bind, lambda row: row.rank)
+    else:
+        rows = session.exec(hero_search_query, params=bind)
+    return [HeroResponse.model_validate(row) for row in rows]
+
+
+### Startup timing endpoint ###
+
+@router.get("/heroes/startup")
+def read_startup_timings():
+    return {"fast_startup": fast_startup, **startup_timings}
+
+
+### Hero statistics endpoint ###
+
+@router.get("/heroes/stats")
+def read_hero_stats():
+    return hero_stats.snapshot()
+
+# Last statement of the module: models, engines and routes are all built
+import_ms = round((time.perf_counter() - module_started_at) * 1000, 3)
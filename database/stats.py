@@ -0,0 +1,65 @@
+import threading
+import time
+from collections import Counter
+from typing import Iterable
+
+### Incrementally maintained age statistics ###
+
+# Keeps a row count and an age histogram in memory so they can be served in
+# O(1). Writers report (age, +1/-1) deltas once their transaction commits;
+# `reset()` replaces everything with freshly counted values from the
+# database to correct any drift between reconciliations.
+
+class AgeStats:
+    def __init__(self, bucket_width: int = 10):
+        self.bucket_width = bucket_width
+        self.total = 0
+        self.buckets: Counter[int | None] = Counter()
+        self.reconciled_at: float | None = None
+        self.last_drift = 0
+        self._lock = threading.Lock()
+
+    def bucket(self, age: int | None) -> int | None:
+        if age is None:
+            return None
+        return age // self.bucket_width * self.bucket_width
+
+    def apply(self, deltas: Iterable[tuple[int | None, int]]) -> None:
+        with self._lock:
+            for age, change in deltas:
+                self.total += change
+                self.buckets[self.bucket(age)] += change
+
+    def reset(self, age_counts: Iterable[tuple[int | None, int]]) -> None:
+        buckets: Counter[int | None] = Counter()
+        for age, count in age_counts:
+            buckets[self.bucket(age)] += count
+        with self._lock:
+            drift = abs(sum(buckets.values()) - self.total)
+            for bucket in buckets.keys() | self.buckets.keys():
+                drift += abs(buckets[bucket] - self.buckets[bucket])
+            self.total = sum(buckets.values())
+            self.buckets = buckets
+            self.reconciled_at = time.time()
+            self.last_drift = drift
+
+    def label(self, bucket: int | None) -> str:
+        if bucket is None:
+            return "unknown"
+        return f"{bucket}-{bucket + self.bucket_width - 1}"
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            histogram = {
+                self.label(bucket): count
+                for bucket, count in sorted(
+                    self.buckets.items(), key=lambda item: (item[0] is not None, item[0] or 0)
+                )
+                if count
+            }
+            return {
+                "total": self.total,
+                "age_histogram": histogram,
+                "reconciled_at": self.reconciled_at,
+                "last_drift": self.last_drift,
+            }
@@ -0,0 +1,114 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable
+
+from fastapi import HTTPException
+from sqlmodel import Session
+
+### Group-commit writer ###
+
+# A single thread owns every queued write. Once an operation arrives it keeps
+# collecting more for up to `max_delay` seconds or `max_batch` operations,
+# runs them all in one session and commits once, so N concurrent writers pay
+# for one fsync instead of N and never fight over the SQLite write lock.
+#
+# Sessions come from `session_factory`, so the writer follows whatever the
+# request sessions are bound to (one database file or the hero shards).
+#
+# An operation is a function taking the session plus its arguments. It must
+# not commit; whatever it returns (or the HTTPException it raises) resolves
+# the caller's future. If the batch fails to commit, every operation in it is
+# retried in its own transaction so only the bad write fails.
+
+Operation = Callable[..., Any]
+
+class GroupCommitWriter:
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        max_batch: int = 64,
+        max_delay: float = 0.002,
+        after_commit: Callable[[], None] | None = None,
+    ):
+        self.session_factory = session_factory
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.after_commit = after_commit
+        self._queue: queue.Queue[tuple[Future, Operation, tuple] | None] = queue.Queue()
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="group-commit-writer", daemon=True
+                )
+                self._thread.start()
+
+    def stop(self) -> None:
+        with self._lock:
+            if self._thread is not None:
+                self._queue.put(None)
+                self._thread.join()
+                self._thread = None
+
+    def submit(self, operation: Operation, *args: Any) -> Future:
+        self.start()
+        future: Future = Future()
+        self._queue.put((future, operation, args))
+        return future
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._write(batch)
+                    return
+                batch.append(item)
+            self._write(batch)
+
+    def _write(self, batch: list[tuple[Future, Operation, tuple]]) -> None:
+        # Callers that gave up while queued (e.g. a disconnected client) are skipped
+        running = [item for item in batch if item[0].set_running_or_notify_cancel()]
+        try:
+            outcomes = self._commit(running)
+        except Exception:
+            outcomes = []
+            for item in running:
+                try:
+                    outcomes += self._commit([item])
+                except Exception as exc:
+                    outcomes.append((item[0], None, exc))
+        for future, result, exc in outcomes:
+            if exc is None:
+                future.set_result(result)
+            else:
+                future.set_exception(exc)
+
+    def _commit(self, items: list[tuple[Future, Operation, tuple]]) -> list:
+        outcomes = []
+        with self.session_factory() as session:
+            for future, operation, args in items:
+                try:
+                    outcomes.append((future, operation(session, *args), None))
+                except HTTPException as exc:
+                    outcomes.append((future, None, exc))
+            session.commit()
+        if self.after_commit:
+            self.after_commit()
+        return outcomes
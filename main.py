@@ -6,7 +6,7 @@ from query import queryparameters_models, queryparameters_validation
 from body import body_multipleparams, bodyfields
 from response import responsemodel_returntype
 from security import oauth2, oauth2_jwt
-from database import sql_databases
+from database import instrumentation, sql_databases
 
 class ModelName(str, Enum):
     alexnet = "alexnet"
@@ -26,6 +26,8 @@ app.include_router(responsemodel_returntype.router, tags=["response model return
 app.include_router(oauth2.router, tags=["security oauth2"])
 app.include_router(oauth2_jwt.router, tags=["security oauth2 jwt"])
 app.include_router(sql_databases.router, tags=["database sql databases"])
+app.include_router(instrumentation.router, tags=["database instrumentation"])
+app.add_middleware(instrumentation.QueryInstrumentationMiddleware)
 
 @app.get("/")
 async def root():
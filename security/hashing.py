@@ -0,0 +1,124 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable
+
+from fastapi import HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from passlib.context import CryptContext
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+def verify_password(plain_password: str, hashed_password: str):
+    return pwd_context.verify(plain_password, hashed_password)
+
+def get_password_hash(password):
+    return pwd_context.hash(password)
+
+### Password hashing pool ###
+
+# bcrypt is deliberately slow (~250 ms per check at cost 12), so it must never
+# run on the event loop. Hashes and verifications go to a small process pool
+# instead; the processes come from a forkserver rather than forking the
+# running server and its threads. AUTH_HASH_WORKERS=0 falls back to the
+# threadpool.
+#
+# At most `max_pending` operations may be queued or running; beyond that
+# callers get a 503 straight away rather than waiting behind a login storm.
+# The counters are only touched from the event loop, so they need no lock.
+# If a worker dies (OOM kill, crash) the whole executor is broken; it is
+# replaced and the operation retried once.
+
+hash_workers = int(os.getenv("AUTH_HASH_WORKERS", "2"))
+hash_max_pending = int(os.getenv("AUTH_HASH_MAX_PENDING", "256"))
+
+class HashingPool:
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.peak_pending = 0
+        self.completed = 0
+        self.failed = 0
+        self.restarts = 0
+        self.rejected = 0
+        self.duration = 0.0
+        self._executor: Executor | None = None
+
+    def start(self) -> Executor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                self.workers, mp_context=multiprocessing.get_context("forkserver")
+            )
+        return self._executor
+
+    def stop(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+    def restart(self, broken: Executor) -> None:
+        # Concurrent callers may all see the same broken executor
+        if self._executor is broken:
+            self._executor = None
+            self.restarts += 1
+            broken.shutdown(wait=False, cancel_futures=True)
+
+    async def submit(self, function: Callable[..., Any], *args: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        executor = self.start()
+        try:
+            return await loop.run_in_executor(executor, function, *args)
+        except BrokenProcessPool:
+            self.restart(executor)
+            return await loop.run_in_executor(self.start(), function, *args)
+
+    async def run(self, function: Callable[..., Any], *args: Any) -> Any:
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many pending password checks",
+                headers={"Retry-After": "1"},
+            )
+        self.pending += 1
+        self.peak_pending = max(self.peak_pending, self.pending)
+        started_at = time.perf_counter()
+        try:
+            if self.workers:
+                result = await self.submit(function, *args)
+            else:
+                result = await run_in_threadpool(function, *args)
+        except BaseException:
+            self.failed += 1
+            raise
+        finally:
+            self.pending -= 1
+        self.completed += 1
+        self.duration += time.perf_counter() - started_at
+        return result
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self.run(verify_password, plain_password, hashed_password)
+
+    async def hash(self, password: str) -> str:
+        return await self.run(get_password_hash, password)
+
+    def snapshot(self) -> dict:
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "pending": self.pending,
+            "queued": max(self.pending - self.workers, 0) if self.workers else None,
+            "peak_pending": self.peak_pending,
+            "completed": self.completed,
+            "failed": self.failed,
+            "restarts": self.restarts,
+            "rejected": self.rejected,
+            "avg_ms": round(self.duration * 1000 / self.completed, 3) if self.completed else None,
+        }
+
+password_hasher = HashingPool(hash_workers, hash_max_pending)
@@ -1,17 +1,47 @@
+import asyncio
+import hashlib
+import os
+import sys
+import time
+import uuid
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta, timezone
 from typing import Annotated
 
 import jwt
-from fastapi import Depends, APIRouter, HTTPException, status
+from fastapi import Depends, APIRouter, Form, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jwt.exceptions import InvalidTokenError
-from passlib.context import CryptContext
 from pydantic import BaseModel
+from sqlalchemy import bindparam, update
+from sqlmodel import Field, Session, SQLModel, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from database.cache import LRUCache
+from database.sql_databases import async_engine, engine, run_periodically
+from security.hashing import get_password_hash, password_hasher, pwd_context, verify_password
+from security.refresh import (
+    RefreshToken,
+    create_refresh_table,
+    purge_refresh_tokens,
+    revoke_session,
+    rotate_refresh_token,
+    store_refresh_token,
+)
+from security.revocation import (
+    create_revocation_table,
+    revocation_list,
+    revocation_purge_interval,
+    revocation_sync_interval,
+)
 
 SECRET_KEY = "0d2d09706f3c42762dd5f96b9344ced6b8ca4db37a7053071599b288cc1d92bd"
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 30
+# Access tokens stay short-lived; clients renew them at /token/refresh
+ACCESS_TOKEN_EXPIRE_MINUTES = 15
+REFRESH_TOKEN_EXPIRE_DAYS = 7
 
+# Demo users, inserted into the user table on startup when missing
 fake_users_db = {
         "johndoe": {
         "username": "johndoe",
@@ -25,44 +55,130 @@ fake_users_db = {
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: str | None = None
     
 class TokenData(BaseModel):
     username: str | None = None
     
-class User(BaseModel):
-    username: str
+class User(SQLModel):
+    username: str = Field(index=True, unique=True)
     email: str | None = None
     full_name: str | None = None
     disabled: bool | None = None
     
-class UserInDB(User):
+# Lives in the same SQLModel metadata and database file as the heroes
+class UserInDB(User, table=True):
+    __tablename__ = "user"
+    id: int | None = Field(default=None, primary_key=True)
     hashed_password: str
     
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-router = APIRouter()
+def create_user_table():
+    UserInDB.__table__.create(engine, checkfirst=True)
+    with Session(engine) as session:
+        existing = set(session.exec(select(UserInDB.username)))
+        for username, user_dict in fake_users_db.items():
+            if username not in existing:
+                session.add(UserInDB(**user_dict))
+        session.commit()
+    invalidate_users()
+
+@asynccontextmanager
+async def lifespan(app: APIRouter):
+    create_user_table()
+    create_revocation_table()
+    create_refresh_table()
+    tasks = [
+        asyncio.create_task(run_periodically(revocation_sync_interval, revocation_list.sync)),
+        asyncio.create_task(run_periodically(revocation_purge_interval, revocation_list.purge)),
+        asyncio.create_task(run_periodically(revocation_purge_interval, purge_refresh_tokens)),
+    ]
+    yield
+    for task in tasks:
+        task.cancel()
+    password_hasher.stop()
 
-def verify_password(plain_password: str, hashed_password: str):
-    return pwd_context.verify(plain_password, hashed_password)
+router = APIRouter(lifespan=lifespan)
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+### Cached user lookups ###
 
-def get_user(db, username: str):
-    if username in db:
-        user_dict = db[username]
-        return UserInDB(**user_dict)
+# get_user() answers from memory whenever it can, so a cached login or token
+# check opens no session at all. Unknown usernames are remembered too, in a
+# separate cache, so credential stuffing with made-up names neither reaches
+# the database nor evicts real users. Anything that changes a user must call
+# invalidate_users().
 
-def authenticate_user(fake_db, username: str, password: str):
-    user = get_user(fake_db, username)
+user_cache = LRUCache(
+    maxsize=int(os.getenv("AUTH_USER_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("AUTH_USER_CACHE_TTL", "300")),
+)
+unknown_user_cache = LRUCache(
+    maxsize=int(os.getenv("AUTH_UNKNOWN_USER_CACHE_SIZE", "100000")),
+    ttl=float(os.getenv("AUTH_UNKNOWN_USER_CACHE_TTL", "30")),
+)
+
+user_by_name = select(UserInDB).where(UserInDB.username == bindparam("username"))
+
+async def get_user(username: str) -> UserInDB | None:
+    user = user_cache.get(username)
+    if user is not None or unknown_user_cache.get(username):
+        return user
+    generation = user_cache.generation
+    unknown_generation = unknown_user_cache.generation
+    async with AsyncSession(async_engine) as session:
+        result = await session.exec(user_by_name, params={"username": username})
+        user = result.first()
+    if user is None:
+        unknown_user_cache.set(username, True, unknown_generation)
+    else:
+        user_cache.set(username, user, generation)
+    return user
+
+def invalidate_users():
+    user_cache.invalidate()
+    unknown_user_cache.invalidate()
+    token_cache.invalidate()
+
+# bcrypt runs in the hashing pool (see security/hashing.py), not on the event loop
+async def authenticate_user(username: str, password: str):
+    user = await get_user(username)
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    if not await password_hasher.verify(password, user.hashed_password):
         return False
     return user
 
+async def disable_user(username: str):
+    async with AsyncSession(async_engine) as session:
+        await session.execute(
+            update(UserInDB).where(UserInDB.username == username).values(disabled=True)
+        )
+        await session.commit()
+    invalidate_users()
+
+### Verified-token cache ###
+
+# Clients reuse one token for many calls, so the user a token resolves to is
+# cached under the token's SHA-256 digest (the token itself is not kept)
+# until the token expires or `token_cache_ttl` passes, whichever comes first.
+# invalidate_users() empties it along with the user caches. The token's jti is
+# cached alongside the user, so revocation is still checked on every hit.
+
+token_cache_size = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "1024"))
+token_cache_ttl = float(os.getenv("AUTH_TOKEN_CACHE_TTL", "60"))
+token_cache = LRUCache(maxsize=token_cache_size, ttl=token_cache_ttl)
+
+def token_digest(token: str) -> bytes:
+    return hashlib.sha256(token.encode()).digest()
+
+def cached_user_size(value) -> int:
+    if isinstance(value, tuple):
+        return sys.getsizeof(value) + sum(map(cached_user_size, value))
+    if isinstance(value, BaseModel):
+        return sys.getsizeof(value) + sum(map(sys.getsizeof, value.__dict__.values()))
+    return sys.getsizeof(value)
+
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode = data.copy()
     if expires_delta:
@@ -70,7 +186,9 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
     else:
         expire = datetime.now(timezone.utc) + timedelta(minutes=15)
         
+    # jti identifies the token for revocation
     to_encode.update({"exp": expire})
+    to_encode.setdefault("jti", uuid.uuid4().hex)
     encode_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encode_jwt
 
@@ -80,20 +198,36 @@ async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]):
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    key = token_digest(token)
+    cached = token_cache.get(key)
+    if cached is not None:
+        jti, user = cached
+        if jti and await revocation_list.is_revoked(jti):
+            raise credentials_exception
+        return user
+    generation = token_cache.generation
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username = payload.get("sub")
-        if username is None:
+        if username is None or payload.get("typ") == "refresh":
             raise credentials_exception
         token_data = TokenData(username=username)
     except InvalidTokenError:
         raise credentials_exception
     if token_data.username is None:
         raise credentials_exception
+    # Tokens issued before jti was added can't be revoked; they expire soon
+    jti = payload.get("jti")
+    if jti and await revocation_list.is_revoked(jti):
+        raise credentials_exception
     
-    user = get_user(fake_users_db, username=token_data.username)
+    user = await get_user(token_data.username)
     if user is None:
         raise credentials_exception
+    ttl = token_cache_ttl
+    if "exp" in payload:
+        ttl = min(payload["exp"] - time.time(), ttl)
+    token_cache.set(key, (jti, user), generation, ttl)
     return user
 
 async def get_current_active_user(
@@ -107,19 +241,92 @@ async def get_current_active_user(
 async def login_for_access_token(
     form_data: Annotated[OAuth2PasswordRequestForm, Depends()]
 ) -> Token:
-    user = authenticate_user(fake_users_db, form_data.username, form_data.password)
+    user = await authenticate_user(form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    token, refresh_row = issue_tokens(user.username, family=uuid.uuid4().hex)
+    await store_refresh_token(refresh_row)
+    return token
+
+### Refresh tokens ###
+
+# Renewing a session costs a signature check and one small transaction
+# instead of a bcrypt verify. Refresh tokens are JWTs with typ "refresh"
+# and are rotated on every use; see security/refresh.py for reuse detection.
+
+def issue_tokens(username: str, family: str) -> tuple[Token, RefreshToken]:
+    now = datetime.now(timezone.utc)
+    access_jti = uuid.uuid4().hex
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
+        data={"sub": username, "jti": access_jti}, expires_delta=access_token_expires
     )
-    return Token(access_token=access_token, token_type="bearer")
+    refresh_jti = uuid.uuid4().hex
+    refresh_expire = now + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    refresh_token = jwt.encode(
+        {"sub": username, "jti": refresh_jti, "fam": family, "typ": "refresh", "exp": refresh_expire},
+        SECRET_KEY,
+        algorithm=ALGORITHM,
+    )
+    refresh_row = RefreshToken(
+        jti=refresh_jti,
+        family=family,
+        username=username,
+        expires_at=int(refresh_expire.timestamp()),
+        access_jti=access_jti,
+        access_expires_at=int((now + access_token_expires).timestamp()),
+    )
+    return Token(access_token=access_token, token_type="bearer", refresh_token=refresh_token), refresh_row
 
+@router.post("/token/refresh")
+async def refresh_access_token(
+    refresh_token: Annotated[str, Form()],
+    grant_type: Annotated[str, Form(pattern="^refresh_token$")] = "refresh_token",
+) -> Token:
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate refresh token",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    try:
+        payload = jwt.decode(refresh_token, SECRET_KEY, algorithms=[ALGORITHM])
+    except InvalidTokenError:
+        raise credentials_exception
+    if payload.get("typ") != "refresh" or not all(payload.get(claim) for claim in ("sub", "jti", "fam")):
+        raise credentials_exception
+    user = await get_user(payload["sub"])
+    if user is None or user.disabled:
+        raise credentials_exception
+    token, refresh_row = issue_tokens(user.username, family=payload["fam"])
+    outcome = await rotate_refresh_token(payload["jti"], refresh_row)
+    if outcome == "reused":
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Refresh token was already used; the session has been revoked",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    if outcome != "rotated":
+        raise credentials_exception
+    return token
+
+# Revokes the presented token, e.g. on logout, together with the refresh
+# token family from the same login. Other workers pick the revocation up
+# within AUTH_REVOCATION_SYNC_INTERVAL seconds.
+@router.post("/token/revoke")
+async def revoke_access_token(
+    token: Annotated[str, Depends(oauth2_scheme)],
+    current_user: Annotated[User, Depends(get_current_user)],
+):
+    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    if "jti" not in payload:
+        raise HTTPException(status_code=400, detail="Token has no jti and cannot be revoked")
+    await revocation_list.revoke(payload["jti"], payload["exp"])
+    await revoke_session(payload["jti"])
+    return {"ok": True}
 
 @router.get("/users/me/oauth2")
 async def read_users_me_oauth2(
@@ -131,4 +338,17 @@ async def read_users_me_oauth2(
 async def read_own_items_oauth2(
     current_user: Annotated[User, Depends(get_current_active_user)]
 ):
-    return [{"item": "Item 1", "owner": current_user.username}]
\ No newline at end of file
+    return [{"item": "Item 1", "owner": current_user.username}]
+
+@router.get("/auth/metrics")
+async def read_auth_metrics():
+    return {
+        "hashing": password_hasher.snapshot(),
+        "users": user_cache.stats(),
+        "unknown_users": unknown_user_cache.stats(),
+        "revocations": revocation_list.snapshot(),
+        "token_cache": {
+            **token_cache.stats(),
+            "approx_bytes": token_cache.footprint(cached_user_size),
+        },
+    }
@@ -0,0 +1,97 @@
+import time
+
+from sqlalchemy import bindparam, delete, insert, update
+from sqlmodel import Field, SQLModel, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from database.sql_databases import async_engine, engine
+from security.revocation import revocation_list
+
+### Rotating refresh tokens ###
+
+# Every refresh token is a row keyed by its jti. A login starts a new family;
+# each refresh marks the presented token used and adds its successor, plus
+# the access token issued with it, to the same family in one transaction.
+# Presenting a used token again means it was copied, so the whole family is
+# marked used and its access tokens go on the revocation list. Rows stay
+# until they expire so late reuse is still caught. Logging out ends the
+# family the same way, found through the access token being revoked.
+
+class RefreshToken(SQLModel, table=True):
+    __tablename__ = "refresh_token"
+    jti: str = Field(primary_key=True)
+    family: str = Field(index=True)
+    username: str
+    expires_at: int = Field(index=True)
+    access_jti: str = Field(index=True)
+    access_expires_at: int
+    used: bool = False
+
+refresh_table = RefreshToken.__table__
+
+# The UPDATE only matches an unused token, so of two concurrent refreshes
+# with the same token exactly one rotates it
+mark_used = (
+    update(RefreshToken)
+    .where(RefreshToken.jti == bindparam("presented_jti"), RefreshToken.used.is_(False))
+    .values(used=True)
+    .returning(RefreshToken.family)
+)
+
+family_of = select(RefreshToken.family).where(RefreshToken.jti == bindparam("presented_jti"))
+
+family_of_access = select(RefreshToken.family).where(
+    RefreshToken.access_jti == bindparam("access_jti")
+)
+
+family_access_tokens = (
+    update(RefreshToken)
+    .where(RefreshToken.family == bindparam("revoked_family"))
+    .values(used=True)
+    .returning(RefreshToken.access_jti, RefreshToken.access_expires_at)
+)
+
+purge_expired = delete(RefreshToken).where(RefreshToken.expires_at <= bindparam("now"))
+
+def create_refresh_table():
+    refresh_table.create(engine, checkfirst=True)
+    # Tables created before access_jti was indexed get the index here
+    for index in refresh_table.indexes:
+        index.create(engine, checkfirst=True)
+
+async def store_refresh_token(token: RefreshToken) -> None:
+    async with AsyncSession(async_engine) as session:
+        await session.execute(insert(RefreshToken), token.model_dump())
+        await session.commit()
+
+async def rotate_refresh_token(presented_jti: str, successor: RefreshToken) -> str:
+    # Returns "rotated", "reused" (the family is now revoked) or "unknown"
+    async with AsyncSession(async_engine) as session:
+        family = (await session.execute(mark_used, {"presented_jti": presented_jti})).scalar()
+        if family == successor.family:
+            await session.execute(insert(RefreshToken), successor.model_dump())
+            await session.commit()
+            return "rotated"
+        if family is None:
+            family = (await session.execute(family_of, {"presented_jti": presented_jti})).scalar()
+            if family is None:
+                return "unknown"
+        await revoke_family(session, family)
+    return "reused"
+
+async def revoke_session(access_jti: str) -> None:
+    # Ends the login the access token belongs to, if it came with a refresh token
+    async with AsyncSession(async_engine) as session:
+        family = (await session.execute(family_of_access, {"access_jti": access_jti})).scalar()
+        if family is not None:
+            await revoke_family(session, family)
+
+async def revoke_family(session: AsyncSession, family: str) -> None:
+    access_tokens = (await session.execute(family_access_tokens, {"revoked_family": family})).all()
+    await session.commit()
+    for access_jti, access_expires_at in access_tokens:
+        await revocation_list.revoke(access_jti, access_expires_at)
+
+def purge_refresh_tokens() -> None:
+    with engine.begin() as connection:
+        connection.execute(purge_expired, {"now": int(time.time())})
@@ -0,0 +1,174 @@
+import hashlib
+import math
+import os
+import threading
+import time
+
+from sqlalchemy import bindparam, delete, insert
+from sqlmodel import Field, SQLModel, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from database.cache import LRUCache
+from database.sql_databases import async_engine, engine
+
+### Bloom filter ###
+
+# A fixed-size bit array sized for `capacity` keys at the given false
+# positive rate. Membership tests never give false negatives, so a miss
+# proves a token was not revoked without touching the database.
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float):
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        # Each hash is 4 bytes of one blake2b digest, which tops out at 64
+        self.hashes = min(16, max(1, round(self.size / capacity * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def positions(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=4 * self.hashes).digest()
+        return (value % self.size for value in memoryview(digest).cast("I"))
+
+    def add(self, key: str) -> None:
+        for position in self.positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        bits = self.bits
+        for position in self.positions(key):
+            if not bits[position >> 3] >> (position & 7) & 1:
+                return False
+        return True
+
+    def false_positive_rate(self) -> float:
+        return (1 - math.exp(-self.hashes * self.count / self.size)) ** self.hashes
+
+### Revoked tokens ###
+
+# Rows are only ever appended, and AUTOINCREMENT ids are never reused even
+# after expired rows are purged, so the table doubles as the change log:
+# every worker remembers the last id it has seen and periodically adds newer
+# rows to its own filter.
+#
+# Reading a large table into the filter takes seconds, so it is not done at
+# startup: the first periodic sync loads it in the threadpool, and until a
+# load has succeeded every check goes to the database instead.
+
+class RevokedToken(SQLModel, table=True):
+    __tablename__ = "revoked_token"
+    __table_args__ = {"sqlite_autoincrement": True}
+    id: int | None = Field(default=None, primary_key=True)
+    jti: str = Field(index=True, unique=True)
+    expires_at: int = Field(index=True)
+
+revoked_table = RevokedToken.__table__
+
+revoked_since = select(RevokedToken.id, RevokedToken.jti).where(
+    RevokedToken.id > bindparam("last_id"),
+    RevokedToken.expires_at > bindparam("now"),
+).order_by(RevokedToken.id)
+
+revoked_by_jti = select(RevokedToken.id).where(RevokedToken.jti == bindparam("jti"))
+
+# Tokens expire on their own, so rows past their exp can go
+purge_expired = delete(RevokedToken).where(RevokedToken.expires_at <= bindparam("now"))
+
+class RevocationList:
+    def __init__(self, capacity: int, error_rate: float, recheck_after: float):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.recheck_after = recheck_after
+        self.filter = BloomFilter(capacity, error_rate)
+        self.last_id = 0
+        self.loaded = False
+        self.lookups = 0
+        # Database answers for filter hits. A revoked jti stays revoked; a
+        # false positive is rechecked as often as other workers sync.
+        self.confirmed = LRUCache(maxsize=10_000, ttl=3600)
+        self._lock = threading.Lock()
+
+    def read_since(self, last_id: int) -> list:
+        with engine.connect() as connection:
+            return connection.execute(
+                revoked_since, {"last_id": last_id, "now": int(time.time())}
+            ).all()
+
+    def sync(self) -> None:
+        if not self.loaded:
+            self.load()
+            return
+        with self._lock:
+            for self.last_id, jti in self.read_since(self.last_id):
+                # This worker's own revocations are in the filter already
+                if jti not in self.filter:
+                    self.filter.add(jti)
+                self.confirmed.delete(jti)
+
+    def load(self) -> None:
+        # Rebuilds the filter from the unexpired rows; purged jtis drop out
+        bloom = BloomFilter(self.capacity, self.error_rate)
+        rows = self.read_since(0)
+        for _, jti in rows:
+            bloom.add(jti)
+        with self._lock:
+            self.filter = bloom
+            self.last_id = rows[-1][0] if rows else 0
+            self.loaded = True
+        # Catches revocations committed while the rows were being read
+        self.sync()
+
+    def purge(self) -> None:
+        with engine.begin() as connection:
+            purged = connection.execute(purge_expired, {"now": int(time.time())}).rowcount
+        # Rebuilding costs a full read, so only once enough of the filter is stale
+        if purged and purged * 4 >= self.filter.count:
+            self.load()
+
+    async def revoke(self, jti: str, expires_at: int) -> None:
+        async with AsyncSession(async_engine) as session:
+            await session.execute(
+                insert(RevokedToken).prefix_with("OR IGNORE"),
+                {"jti": jti, "expires_at": expires_at},
+            )
+            await session.commit()
+        if jti not in self.filter:
+            self.filter.add(jti)
+        self.confirmed.delete(jti)
+
+    async def is_revoked(self, jti: str) -> bool:
+        if self.loaded and jti not in self.filter:
+            return False
+        revoked = self.confirmed.get(jti)
+        if revoked is None:
+            self.lookups += 1
+            async with AsyncSession(async_engine) as session:
+                result = await session.execute(revoked_by_jti, {"jti": jti})
+                revoked = result.first() is not None
+            self.confirmed.set(jti, revoked, ttl=None if revoked else self.recheck_after)
+        return revoked
+
+    def snapshot(self) -> dict:
+        return {
+            "loaded": self.loaded,
+            "tokens": self.filter.count,
+            "capacity": self.capacity,
+            "filter_bytes": len(self.filter.bits),
+            "hashes": self.filter.hashes,
+            "false_positive_rate": round(self.filter.false_positive_rate(), 6),
+            "last_id": self.last_id,
+            "database_lookups": self.lookups,
+            "confirmed": self.confirmed.stats(),
+        }
+
+revocation_capacity = int(os.getenv("AUTH_REVOCATION_CAPACITY", "1000000"))
+revocation_error_rate = float(os.getenv("AUTH_REVOCATION_ERROR_RATE", "0.001"))
+revocation_sync_interval = float(os.getenv("AUTH_REVOCATION_SYNC_INTERVAL", "1"))
+revocation_purge_interval = float(os.getenv("AUTH_REVOCATION_PURGE_INTERVAL", "3600"))
+
+revocation_list = RevocationList(
+    revocation_capacity, revocation_error_rate, revocation_sync_interval
+)
+
+def create_revocation_table():
+    revoked_table.create(engine, checkfirst=True)
@@ -0,0 +1,27 @@
+import os
+import shutil
+import tempfile
+
+import pytest
+from fastapi.testclient import TestClient
+
+### Test app ###
+
+# The database is the relative "database.db", and SQLAlchemy resolves it when
+# the engine is created, so the move to an empty directory has to happen
+# before any test module imports the app. Every run starts from a fresh file.
+
+def pytest_configure(config):
+    config.workdir = tempfile.mkdtemp(prefix="eduread-tests-")
+    os.chdir(config.workdir)
+
+def pytest_unconfigure(config):
+    os.chdir(config.invocation_params.dir)
+    shutil.rmtree(config.workdir, ignore_errors=True)
+
+@pytest.fixture(scope="session")
+def client():
+    import main
+
+    with TestClient(main.app) as client:
+        yield client
@@ -0,0 +1,43 @@
+import asyncio
+import time
+from uuid import uuid4
+
+from database.sql_databases import run_periodically
+from security.revocation import RevocationList, revocation_list
+
+### Periodic jobs ###
+
+def test_periodic_job_survives_failures(caplog):
+    runs = []
+
+    def job():
+        runs.append(time.monotonic())
+        if len(runs) <= 2:
+            raise RuntimeError("database is locked")
+
+    async def run_for_a_while():
+        task = asyncio.create_task(run_periodically(0.01, job))
+        while len(runs) < 4:
+            await asyncio.sleep(0.01)
+        task.cancel()
+
+    asyncio.run(run_for_a_while())
+    failures = [record for record in caplog.records if "failed" in record.getMessage()]
+    assert len(failures) == 2
+    assert failures[0].exc_info[0] is RuntimeError
+
+### Revocation list loading ###
+
+# A worker that has not loaded its filter yet must still see revocations
+
+def test_revocations_are_checked_before_the_filter_loads(client):
+    revoked = uuid4().hex
+    client.portal.call(revocation_list.revoke, revoked, int(time.time()) + 60)
+    revocations = RevocationList(1000, 0.01, 1)
+    assert not revocations.loaded
+    assert client.portal.call(revocations.is_revoked, revoked)
+    assert not client.portal.call(revocations.is_revoked, uuid4().hex)
+    revocations.sync()
+    assert revocations.loaded
+    assert revocations.filter.count >= 1
+    assert client.portal.call(revocations.is_revoked, revoked)
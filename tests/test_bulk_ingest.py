@@ -0,0 +1,16 @@
+### Bulk hero ingestion ###
+
+def test_bulk_rows_with_nulls_are_one_statement(client):
+    rows = [
+        {"name": f"Bulk {i}", "secret_name": "Secret", "age": None if i % 3 == 0 else i}
+        for i in range(300)
+    ]
+    response = client.post("/heroes/bulk", json=rows)
+    assert response.json() == {"received": 300, "inserted": 300, "errors": []}
+    assert response.headers["x-db-query-count"] == "1"
+
+def test_bulk_rows_are_validated_one_by_one(client):
+    rows = [{"name": "Valid", "secret_name": "Secret"}, {"name": "No secret"}]
+    result = client.post("/heroes/bulk", json=rows).json()
+    assert result["inserted"] == 1
+    assert [error["row"] for error in result["errors"]] == [1]
@@ -0,0 +1,16 @@
+### Query metrics ###
+
+# /db/metrics needs no login, so it must never echo parameter values
+
+def test_metrics_hide_parameter_values(client):
+    response = client.post("/heroes/", json={"name": "Dive", "secret_name": "TOPSECRET-xyz"})
+    assert response.status_code == 200
+    metrics = client.get("/db/metrics")
+    assert "TOPSECRET-xyz" not in metrics.text
+    slowest = metrics.json()["recent"][-1]["slowest"]
+    assert "str" in slowest["parameters"]
+
+def test_metrics_hide_login_details(client):
+    client.post("/token", data={"username": "johndoe", "password": "not-the-password"})
+    recent = client.get("/db/metrics").json()["recent"]
+    assert all("johndoe" not in str(request["slowest"]) for request in recent)
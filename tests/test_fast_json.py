@@ -0,0 +1,53 @@
+import pytest
+
+from database import sql_databases
+
+### Fast hero list serialization ###
+
+# HEROES_FAST_JSON=1 must not change a single byte of the hero list
+
+awkward_names = [
+    "Zoë Ångström",
+    "行者",
+    "Line\u2028Paragraph\u2029Separators",
+    'Quote "Marks" and \\backslash\\',
+    "Tab\tand\nnewline",
+    "</script><script>",
+    "🦸 Emoji",
+]
+
+@pytest.fixture(scope="module")
+def awkward_heroes(client):
+    for i, name in enumerate(awkward_names):
+        hero = {"name": f"~{name}", "secret_name": "Secret", "age": None if i % 2 else i}
+        assert client.post("/heroes/", json=hero).status_code == 200
+
+def hero_list(client, monkeypatch, fast: bool, params: dict):
+    monkeypatch.setattr(sql_databases, "use_fast_json", fast)
+    sql_databases.hero_page_cache.invalidate()
+    response = client.get("/heroes/", params=params)
+    assert response.status_code == 200
+    headers = {
+        name: value for name, value in response.headers.items() if name != "x-db-time-ms"
+    }
+    return response.content, headers
+
+@pytest.mark.parametrize(
+    "params",
+    [
+        {"name_prefix": "~"},
+        {"name_prefix": "~", "order_by": "age", "limit": 3},
+        {"order_by": "name", "limit": 100},
+        {},
+    ],
+)
+def test_fast_json_matches_default(client, monkeypatch, awkward_heroes, params):
+    default = hero_list(client, monkeypatch, False, params)
+    fast = hero_list(client, monkeypatch, True, params)
+    assert fast == default
+
+def test_awkward_names_survive(client, monkeypatch, awkward_heroes):
+    content, _ = hero_list(client, monkeypatch, True, {"name_prefix": "~"})
+    assert "\u2028".encode() in content
+    heroes = client.get("/heroes/", params={"name_prefix": "~"}).json()
+    assert {hero["name"][1:] for hero in heroes} == set(awkward_names)
@@ -0,0 +1,62 @@
+from sqlmodel import Session
+
+from database import sql_databases
+from database.cache import LRUCache
+from database.sql_databases import (
+    HeroUpdate,
+    change_hero,
+    engine,
+    hero_cache,
+    remove_hero,
+)
+
+### Hero cache write-through ###
+
+def test_newer_only_replaces_older_values():
+    cache = LRUCache(maxsize=10, ttl=60)
+    cache.set("hero", 3)
+    cache.set("hero", 2, newer=lambda cached, value: value > cached)
+    assert cache.get("hero") == 3
+    cache.set("hero", 4, newer=lambda cached, value: value > cached)
+    assert cache.get("hero") == 4
+
+def run_between_commit_and_cache(monkeypatch, interleaved):
+    # change_hero drops the page cache after its commit and before it caches
+    # the hero, the window in which another request can finish a write
+    invalidate = sql_databases.hero_page_cache.invalidate
+    pending = [interleaved]
+
+    def invalidate_then_interleave():
+        invalidate()
+        while pending:
+            pending.pop()()
+
+    monkeypatch.setattr(sql_databases.hero_page_cache, "invalidate", invalidate_then_interleave)
+
+def test_updates_finishing_out_of_order_keep_the_newer_hero(client, monkeypatch):
+    hero = client.post("/heroes/", json={"name": "Raced", "secret_name": "Secret"}).json()
+
+    def later_update():
+        with Session(engine) as session:
+            change_hero(session, hero["id"], HeroUpdate(age=3))
+
+    run_between_commit_and_cache(monkeypatch, later_update)
+    with Session(engine) as session:
+        change_hero(session, hero["id"], HeroUpdate(age=2))
+    assert hero_cache.get(hero["id"]).age == 3
+    response = client.get(f"/heroes/{hero['id']}")
+    assert response.json()["age"] == 3
+    assert response.headers["etag"] == f'"{hero["id"]}.3"'
+
+def test_delete_during_an_update_is_not_undone_by_the_cache(client, monkeypatch):
+    hero = client.post("/heroes/", json={"name": "Deleted", "secret_name": "Secret"}).json()
+
+    def delete():
+        with Session(engine) as session:
+            remove_hero(session, hero["id"])
+
+    run_between_commit_and_cache(monkeypatch, delete)
+    with Session(engine) as session:
+        change_hero(session, hero["id"], HeroUpdate(age=2))
+    assert hero_cache.get(hero["id"]) is None
+    assert client.get(f"/heroes/{hero['id']}").status_code == 404
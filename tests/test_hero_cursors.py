@@ -0,0 +1,52 @@
+import base64
+import json
+
+import pytest
+
+### Keyset cursors ###
+
+def encode(key) -> str:
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+@pytest.mark.parametrize(
+    "order_by,key",
+    [
+        ("age", ["age", 10**30, 1]),
+        ("age", ["age", -(2**63) - 1, 1]),
+        ("age", ["age", 10, 2**63]),
+        ("id", ["id", 10**30, 10**30]),
+        ("id", ["id", True, True]),
+        ("id", ["id", 1.0, 1]),
+        ("name", ["name", 7, 1]),
+        ("name", ["age", "x", 1]),
+    ],
+)
+def test_malformed_cursor_is_rejected(client, order_by, key):
+    response = client.get("/heroes/", params={"order_by": order_by, "cursor": encode(key)})
+    assert response.status_code == 400
+
+@pytest.mark.parametrize(
+    "order_by,key",
+    [
+        ("age", ["age", 2**63 - 1, 1]),
+        ("age", ["age", -(2**63), 1]),
+        ("age", ["age", None, 1]),
+        ("id", ["id", 2**63 - 1, 2**63 - 1]),
+    ],
+)
+def test_cursor_at_the_integer_limits_is_accepted(client, order_by, key):
+    response = client.get("/heroes/", params={"order_by": order_by, "cursor": encode(key)})
+    assert response.status_code == 200
+
+def test_cursor_pages_cover_every_hero(client):
+    for i in range(7):
+        client.post("/heroes/", json={"name": f"Paged {i}", "secret_name": "Secret"})
+    params = {"order_by": "name", "name_prefix": "Paged ", "limit": 3}
+    names = []
+    while True:
+        response = client.get("/heroes/", params=params)
+        names += [hero["name"] for hero in response.json()]
+        if "x-next-cursor" not in response.headers:
+            break
+        params["cursor"] = response.headers["x-next-cursor"]
+    assert names == [f"Paged {i}" for i in range(7)]
@@ -0,0 +1,82 @@
+import itertools
+import random
+
+import pytest
+from sqlalchemy import text
+
+from database.sql_databases import engine, hero_filters, hero_page
+
+### Hero list query plans ###
+
+# Every statement hero_page can build is planned against a table with enough
+# rows, and ANALYZE statistics, for SQLite to choose between its indexes the
+# way it would in production. Filtered lists and cursor pages must always
+# SEARCH an index. An unfiltered offset page has to walk the table, but in
+# index order rather than through a temporary sort.
+
+# Only ages can be NULL, so only age cursors seek past a NULL value
+page_kinds = [
+    pytest.param(order_by, seek, value_is_null, id=f"{order_by}-{kind}")
+    for order_by in ["id", "name", "age"]
+    for kind, seek, value_is_null in [
+        ("offset", False, False),
+        ("seek", True, False),
+        ("seek-null", True, True),
+    ]
+    if order_by == "age" or not value_is_null
+]
+filter_sets = [
+    filters
+    for size in range(len(hero_filters) + 1)
+    for filters in itertools.combinations(hero_filters, size)
+]
+
+plan_params = {
+    "min_age": 20,
+    "max_age": 40,
+    "name_from": "Sp",
+    "name_to": "Sq",
+    "value": "Spider",
+    "hero_id": 100,
+    "offset": 0,
+    "limit": 10,
+}
+
+@pytest.fixture(scope="module")
+def heroes(client):
+    names = ["Spider", "Spike", "Spy", "Bat", "Iron", "spider", "Sp"]
+    rng = random.Random(1)
+    rows = [
+        {
+            "name": f"{rng.choice(names)}{i}",
+            "age": rng.choice([None, *range(80)]),
+            "secret_name": "secret",
+        }
+        for i in range(3000)
+    ]
+    response = client.post("/heroes/bulk", json=rows)
+    assert response.status_code == 200
+    with engine.begin() as connection:
+        connection.execute(text("ANALYZE"))
+
+def query_plan(statement, params: dict) -> list[str]:
+    with engine.connect() as connection:
+        compiled = statement.compile(connection)
+        values = compiled.construct_params(params)
+        return [
+            row.detail
+            for row in connection.exec_driver_sql(
+                f"EXPLAIN QUERY PLAN {compiled}",
+                tuple(values[name] for name in compiled.positiontup),
+            )
+        ]
+
+@pytest.mark.parametrize("filters", filter_sets, ids=lambda filters: "+".join(filters) or "none")
+@pytest.mark.parametrize("order_by,seek,value_is_null", page_kinds)
+def test_hero_page_plan(heroes, order_by, seek, value_is_null, filters):
+    params = dict(plan_params, value=20 if order_by == "age" else plan_params["value"])
+    plan = query_plan(hero_page(order_by, seek, value_is_null, filters), params)
+    if filters or seek:
+        assert not [step for step in plan if step.startswith("SCAN hero")], plan
+    else:
+        assert not [step for step in plan if "TEMP B-TREE" in step], plan
@@ -0,0 +1,34 @@
+### Hero write statements ###
+
+# Creates, updates and deletes read the hero back through RETURNING, so each
+# write is one statement. X-DB-Query-Count counts every statement the request
+# executed.
+
+def query_count(response) -> int:
+    return int(response.headers["x-db-query-count"])
+
+def test_create_is_one_statement(client):
+    response = client.post("/heroes/", json={"name": "Deadpond", "secret_name": "Dive Wilson"})
+    assert response.status_code == 200
+    assert response.json()["id"] is not None
+    assert query_count(response) == 1
+
+def test_update_is_one_statement(client):
+    hero = client.post("/heroes/", json={"name": "Rusty-Man", "secret_name": "Tommy Sharp"}).json()
+    response = client.patch(f"/heroes/{hero['id']}", json={"age": 48})
+    assert response.status_code == 200
+    assert response.json()["age"] == 48
+    assert query_count(response) == 1
+
+def test_update_of_missing_hero_is_one_statement(client):
+    response = client.patch("/heroes/999999", json={"age": 48})
+    assert response.status_code == 404
+    assert query_count(response) == 1
+
+def test_delete_is_one_statement(client):
+    hero = client.post("/heroes/", json={"name": "Spider-Boy", "secret_name": "Pedro Parqueador"}).json()
+    client.post(f"/heroes/{hero['id']}/powers", json={"name": "Web"})
+    response = client.delete(f"/heroes/{hero['id']}")
+    assert response.status_code == 200
+    assert query_count(response) == 1
+    assert client.get(f"/heroes/{hero['id']}").status_code == 404
@@ -0,0 +1,48 @@
+import pytest
+
+### Integer inputs ###
+
+# Integers beyond SQLite's signed 64-bit range would overflow when bound, so
+# they are turned away as validation errors instead of reaching the database
+
+huge = str(10**30)
+
+@pytest.mark.parametrize(
+    "path,params",
+    [
+        ("/heroes/", {"min_age": huge}),
+        ("/heroes/", {"max_age": f"-{huge}"}),
+        ("/heroes/", {"offset": huge}),
+        ("/heroes/", {"offset": "-1"}),
+        ("/heroes/", {"limit": "-1"}),
+        ("/heroes/details", {"offset": huge}),
+        ("/heroes/search", {"q": "hero", "offset": huge}),
+        ("/teams/", {"offset": huge}),
+        (f"/heroes/{huge}", {}),
+        (f"/teams/{huge}", {}),
+    ],
+)
+def test_reads_reject_out_of_range_integers(client, path, params):
+    assert client.get(path, params=params).status_code == 422
+
+def test_writes_reject_out_of_range_integers(client):
+    hero = {"name": "Big", "secret_name": "Age", "age": 2**63}
+    assert client.post("/heroes/", json=hero).status_code == 422
+    assert client.patch(f"/heroes/{huge}", json={"age": 1}).status_code == 422
+    assert client.patch("/heroes/1", json={"team_id": -(2**63) - 1}).status_code == 422
+    assert client.patch("/heroes/batch", json=[{"id": 2**63, "age": 1}]).status_code == 422
+    assert client.delete(f"/heroes/{huge}").status_code == 422
+    assert client.delete("/heroes/", params={"age_lt": huge}).status_code == 422
+    assert client.post(f"/heroes/{huge}/powers", json={"name": "Flight"}).status_code == 422
+
+def test_out_of_range_if_match_is_a_failed_precondition(client):
+    hero = client.post("/heroes/", json={"name": "Tagged", "secret_name": "Secret"}).json()
+    response = client.patch(
+        f"/heroes/{hero['id']}", json={"age": 1}, headers={"If-Match": f'"{hero["id"]}.{huge}"'}
+    )
+    assert response.status_code == 412
+
+def test_limits_of_the_range_are_accepted(client):
+    params = {"min_age": str(-(2**63)), "max_age": str(2**63 - 1)}
+    assert client.get("/heroes/", params=params).status_code == 200
+    assert client.get(f"/heroes/{2**63 - 1}").status_code == 404
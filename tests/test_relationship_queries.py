@@ -0,0 +1,62 @@
+import pytest
+
+### Relationship loading ###
+
+# Heroes with their team and powers, and teams with their heroes, are loaded
+# eagerly: the number of statements per page must not grow with the page.
+
+def query_count(response) -> int:
+    return int(response.headers["x-db-query-count"])
+
+@pytest.fixture(scope="module")
+def teams(client):
+    # Other modules add heroes too; these are the last ones by id
+    offset = client.get("/heroes/stats").json()["total"]
+    teams = [
+        client.post("/teams/", json={"name": name, "headquarters": headquarters}).json()
+        for name, headquarters in [
+            ("Preventers", "Sharp Tower"),
+            ("Z-Force", "Sister Margaret's Bar"),
+        ]
+    ]
+    for i in range(60):
+        team = teams[i % 3] if i % 3 < len(teams) else None
+        hero = client.post(
+            "/heroes/",
+            json={
+                "name": f"Member {i}",
+                "secret_name": f"Secret {i}",
+                "age": i,
+                "team_id": team and team["id"],
+            },
+        ).json()
+        for power in range(i % 4):
+            client.post(f"/heroes/{hero['id']}/powers", json={"name": f"Power {power}"})
+    return teams, offset
+
+@pytest.mark.parametrize("limit", [1, 10, 50])
+def test_hero_details_statements_do_not_grow_with_page(client, teams, limit):
+    _, offset = teams
+    response = client.get("/heroes/details", params={"offset": offset, "limit": limit})
+    assert response.status_code == 200
+    assert len(response.json()) == limit
+    assert query_count(response) == 2
+
+def test_hero_details_include_team_and_powers(client, teams):
+    (preventers, _), offset = teams
+    heroes = client.get("/heroes/details", params={"offset": offset, "limit": 4}).json()
+    assert [hero["team"] and hero["team"]["id"] for hero in heroes][::3] == [preventers["id"]] * 2
+    assert [len(hero["powers"]) for hero in heroes] == [0, 1, 2, 3]
+
+def test_team_list_is_two_statements(client, teams):
+    response = client.get("/teams/")
+    assert response.status_code == 200
+    assert [len(team["heroes"]) for team in response.json()] == [20, 20]
+    assert query_count(response) == 2
+
+def test_team_is_two_statements(client, teams):
+    (preventers, _), _ = teams
+    response = client.get(f"/teams/{preventers['id']}")
+    assert response.status_code == 200
+    assert len(response.json()["heroes"]) == 20
+    assert query_count(response) == 2
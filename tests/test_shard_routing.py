@@ -0,0 +1,36 @@
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import inspect
+
+from database import sql_databases
+from database.sql_databases import Hero, Team, choose_query_shards, on_heroes
+
+### Hero shard routing ###
+
+@pytest.fixture
+def three_shards(monkeypatch):
+    monkeypatch.setattr(sql_databases, "hero_shard_count", 3)
+    monkeypatch.setattr(sql_databases, "hero_shards", ["0", "1", "2"])
+
+def orm_context(model, parameters=None, execution_options=None):
+    return SimpleNamespace(
+        bind_mapper=inspect(model),
+        parameters=parameters or {},
+        execution_options=execution_options or {},
+    )
+
+def test_statement_routes_to_the_shards_of_its_heroes(three_shards):
+    assert choose_query_shards(orm_context(Hero, execution_options=on_heroes([5]))) == ["1"]
+    context = orm_context(Hero, execution_options=on_heroes([1, 4, 3]))
+    assert choose_query_shards(context) == ["0", "2"]
+
+def test_hero_id_bind_does_not_route(three_shards):
+    # A cursor page binds the id of the last hero it saw
+    context = orm_context(Hero, parameters={"hero_id": 5, "value": 20, "limit": 10})
+    assert choose_query_shards(context) == ["0", "1", "2"]
+    context = orm_context(Hero, parameters={"hero_ids": [1]})
+    assert choose_query_shards(context) == ["0", "1", "2"]
+
+def test_other_tables_stay_on_main(three_shards):
+    assert choose_query_shards(orm_context(Team, execution_options=on_heroes([5]))) == ["main"]
@@ -0,0 +1,80 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlmodel import Session, func, select
+
+from database.sql_databases import (
+    Hero,
+    HeroCreate,
+    engine,
+    stage_hero_create,
+    stage_hero_delete,
+)
+from database.write_queue import GroupCommitWriter
+
+### Group-commit writer under load ###
+
+writers = 500
+
+def broken_write(session: Session):
+    session.exec(text("INSERT INTO no_such_table VALUES (1)"))
+
+@pytest.fixture
+def writer(client):
+    commits = []
+    writer = GroupCommitWriter(lambda: Session(engine), after_commit=lambda: commits.append(1))
+    writer.commits = commits
+    yield writer
+    writer.stop()
+
+def submit_together(writer: GroupCommitWriter, calls: list[tuple]) -> list:
+    # Every thread submits at once so the writer sees them queued together
+    barrier = threading.Barrier(len(calls))
+
+    def call(operation, *args):
+        barrier.wait()
+        return writer.submit(operation, *args)
+
+    with ThreadPoolExecutor(len(calls)) as pool:
+        queued = [pool.submit(call, *args) for args in calls]
+    return [outcome(future.result()) for future in queued]
+
+def outcome(future):
+    try:
+        return future.result(timeout=30)
+    except Exception as exc:
+        return exc
+
+def test_concurrent_writers_get_their_own_results(writer):
+    calls = [
+        (stage_hero_create, HeroCreate(name=f"Queued {i}", secret_name=f"Secret {i}", age=i % 90))
+        for i in range(writers)
+    ]
+    results = submit_together(writer, calls)
+    assert [hero.name for hero in results] == [f"Queued {i}" for i in range(writers)]
+    assert len({hero.id for hero in results}) == writers
+    # Grouped: far fewer commits than writes
+    assert len(writer.commits) < writers / 4
+    with Session(engine) as session:
+        stored = session.exec(
+            select(func.count()).select_from(Hero).where(Hero.name.startswith("Queued "))
+        ).one()
+    assert stored == writers
+
+def test_failing_write_does_not_fail_its_batch(writer):
+    calls = [
+        (stage_hero_create, HeroCreate(name=f"Batched {i}", secret_name="Secret"))
+        for i in range(100)
+    ]
+    calls[10] = (broken_write,)
+    calls[20] = (stage_hero_delete, 10**9)
+    results = submit_together(writer, calls)
+    assert isinstance(results[10], OperationalError)
+    assert isinstance(results[20], HTTPException) and results[20].status_code == 404
+    created = [result for i, result in enumerate(results) if i not in (10, 20)]
+    assert all(hero.name.startswith("Batched ") for hero in created)
+    assert len({hero.id for hero in created}) == 98